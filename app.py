@@ -8,20 +8,46 @@
 # INTERNAL:
 import os # Gets the env variables from .env file
 import secrets # For flask managing session tokens
+import time # For tracking access token expiry
+import hashlib # For fingerprinting access tokens
+import threading # For guarding the account pool
+import json # For serializing cached values in redis
+import uuid # For naming the placeholder refresher
+import pickle # For reading sessions stored before the msgpack switch
+import queue # For waiting on live ticket events
+from collections import OrderedDict # For the LRU account pool
+from functools import lru_cache # For memoizing date formatting
+from concurrent.futures import ThreadPoolExecutor # For running independent EWS calls at the same time
+from concurrent.futures import wait as wait_futures, FIRST_EXCEPTION # For EWS calls running past their deadline
 
 # EXTERNAL:
 from dotenv import load_dotenv # For loading environment variables
-from msal import ConfidentialClientApplication # For interactive authentication
-from flask import Flask, render_template, request, session, redirect, send_from_directory # For creating web app
+from msal import ConfidentialClientApplication, SerializableTokenCache # For interactive authentication
+from flask import Flask, Blueprint, current_app, render_template, stream_template, request, session, redirect,\
+send_from_directory, make_response, jsonify, abort, g, before_render_template, template_rendered,\
+copy_current_request_context, url_for # For creating web app
+from werkzeug.local import LocalProxy # For creating the redis client on first use
+from werkzeug.middleware.proxy_fix import ProxyFix # For the client's address behind nginx
 from redis import Redis # For access token caching
 from flask_session import Session # For session handling
+import msgpack # For compact session serialization
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, multiprocess # For /metrics
+from contextlib import contextmanager # For timing EWS calls
 from exchangelib import DELEGATE, Account, Configuration, ExtendedProperty, FaultTolerance,\
-Task, CalendarItem, OAuth2AuthorizationCodeCredentials, OAUTH2, OAuth2LegacyCredentials, Q # For exporting tickets
+Task, CalendarItem, OAuth2AuthorizationCodeCredentials, OAUTH2, Q, EWSDateTime, UTC # For exporting tickets
 from exchangelib.items import SEND_TO_ALL_AND_SAVE_COPY # For sending time entrys 
-from pytz import timezone # For converting timezones
+from exchangelib.folders import Tasks # For addressing the tickets folder by ID
+from exchangelib.protocol import Protocol # For dropping evicted accounts' cached protocols
+from exchangelib.errors import ErrorFolderNotFound, ErrorInvalidSyncStateData # For detecting a moved/deleted tickets folder
+from exchangelib.errors import ErrorServerBusy, ErrorTooManyObjectsOpened, ErrorTimeoutExpired, RateLimitError,\
+TransportError # For the EWS circuit breaker
 import pytz
 from datetime import datetime, timedelta # For converting times
 import html2text # Handles html responses in calendar items
+import click # For admin commands
+from types import SimpleNamespace # For mirrored tickets
+from ticket_mirror import TicketMirror, MIRROR_DATE_FIELDS # For the local TB Tickets mirror
+from ticket_notifications import TicketNotifier, LiveHub, StreamingNotificationSource, BROADCAST_CHANNEL # For live ticket updates
 
 ###############
 # GLOBALS
@@ -43,41 +69,318 @@ m_sPassword = os.getenv("PASSWORD")
 m_sScope = ["EWS.AccessAsUser.All"]
 m_sHost = os.getenv("REDIS_HOST")
 m_sPort = os.getenv("REDIS_PORT")
+m_sSecretKey = os.getenv("SECRET_KEY") # Session signing key, the same for every worker
+m_sEWSServer = os.getenv("EWS_SERVER", "outlook.office365.com")
+m_sEWSEndpoint = os.getenv("EWS_SERVICE_ENDPOINT") # Full EWS URL, overrides EWS_SERVER (e.g. the fake server in fake_ews.py)
+m_iAccountPoolSize = int(os.getenv("ACCOUNT_POOL_SIZE", "64"))
+m_sTicketsFolder = os.getenv("TICKETS_FOLDER", "TECHBLDRS INC/TB Tickets") # Path below "All Public Folders"
+m_iFolderCacheTTL = int(os.getenv("FOLDER_CACHE_TTL", "86400"))
+m_iTicketCacheTTL = int(os.getenv("TICKET_CACHE_TTL", "60"))
+m_iEWSWorkers = int(os.getenv("EWS_WORKERS", "16"))
+m_iEWSCallTimeout = int(os.getenv("EWS_CALL_TIMEOUT", "30"))
+m_iEWSMaxWait = int(os.getenv("EWS_MAX_WAIT", "10")) # Longest an EWS call waits out throttling before failing
+m_iCircuitThreshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+m_iCircuitWindow = int(os.getenv("CIRCUIT_FAILURE_WINDOW", "60"))
+m_iCircuitCooldown = int(os.getenv("CIRCUIT_COOLDOWN", "30"))
+m_iLastGoodTTL = int(os.getenv("LAST_GOOD_TTL", "86400")) # How long last known good ticket lists are kept
+m_iPlaceholderRefresh = int(os.getenv("PLACEHOLDER_REFRESH_INTERVAL", "30"))
+m_bMirrorEnabled = os.getenv("MIRROR_ENABLED", "false").lower() == "true"
+m_iMirrorSyncInterval = int(os.getenv("MIRROR_SYNC_INTERVAL", "15"))
+m_iTicketPageSize = int(os.getenv("TICKET_PAGE_SIZE", "100"))
+m_iServiceTokenMargin = int(os.getenv("SERVICE_TOKEN_REFRESH_MARGIN", "300"))
+m_iUserTokenMargin = int(os.getenv("USER_TOKEN_REFRESH_MARGIN", "300"))
+m_iTokenCacheTTL = int(os.getenv("TOKEN_CACHE_TTL", str(90 * 24 * 3600))) # Refresh tokens last up to 90 days
+m_iCalendarDays = int(os.getenv("CALENDAR_WINDOW_DAYS", "14"))
+m_iCalendarItems = int(os.getenv("CALENDAR_MAX_ITEMS", "5"))
+m_iCalendarCacheTTL = int(os.getenv("CALENDAR_CACHE_TTL", "300"))
+m_iCalendarBodyCacheSize = int(os.getenv("CALENDAR_BODY_CACHE_SIZE", "5000"))
+m_bCalendarLazyBody = os.getenv("CALENDAR_LAZY_BODY", "false").lower() == "true"
+m_iTimeEntryBatchSize = int(os.getenv("TIME_ENTRY_BATCH_SIZE", "25"))
+m_iMaxTimeEntries = int(os.getenv("MAX_TIME_ENTRIES", "100"))
+m_bTimeEntryJobs = os.getenv("TIME_ENTRY_JOBS", "true").lower() == "true"
+m_iJobWorkers = int(os.getenv("JOB_WORKERS", "4"))
+m_iJobMaxAttempts = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+m_iJobTTL = int(os.getenv("JOB_TTL", "86400"))
+m_iJobRunningTimeout = int(os.getenv("JOB_RUNNING_TIMEOUT", "600")) # Seconds before a job held by a worker counts as stuck
+m_iSingleFlightResultTTL = int(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "5"))
+m_iPortalFreshTTL = int(os.getenv("PORTAL_FRESH_TTL", "30"))
+m_iPortalStaleTTL = int(os.getenv("PORTAL_STALE_TTL", "600")) # Served while refreshing, after the fresh TTL
+m_iPortalClientRate = int(os.getenv("PORTAL_RATE_PER_CLIENT", "120")) # Requests per minute per client ID
+m_iPortalIPRate = int(os.getenv("PORTAL_RATE_PER_IP", "30")) # Requests per minute per remote address
+# Reverse proxies in front of the app adding X-Forwarded-For (1 behind nginx, 0 when clients connect directly).
+# Unset: unknown, so the per-IP portal limit is off rather than counting every visitor as the proxy's address
+m_iProxyFixXFor = int(os.getenv("PROXY_FIX_X_FOR")) if os.getenv("PROXY_FIX_X_FOR") else None
+m_sMetricsToken = os.getenv("METRICS_TOKEN") # When set, /metrics requires "Authorization: Bearer <token>"
+m_bLiveUpdates = os.getenv("LIVE_UPDATES", "false").lower() == "true"
+m_bLoginPrefetch = os.getenv("LOGIN_PREFETCH", "true").lower() == "true"
+m_iLiveConnectionTimeout = int(os.getenv("LIVE_CONNECTION_TIMEOUT", "1")) # Minutes per EWS streaming connection
+m_iLiveHeartbeat = int(os.getenv("LIVE_HEARTBEAT", "15")) # Seconds between keepalives on /live streams
+
+############
+# Metrics
+############
+
+# Prometheus metrics, served by /metrics. Under gunicorn set PROMETHEUS_MULTIPROC_DIR so the
+# workers' metrics are merged (see the Metrics Route).
+REQUEST_SECONDS = Histogram("webtickets_request_seconds", "Request latency by route",
+    ["route", "method", "status"])
+EWS_CALLS = Counter("webtickets_ews_calls_total", "EWS operations by outcome", ["operation", "outcome"])
+EWS_SECONDS = Histogram("webtickets_ews_seconds", "EWS operation duration", ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+REDIS_CALLS = Counter("webtickets_redis_roundtrips_total", "Redis round-trips by command", ["command"])
+REDIS_SECONDS = Histogram("webtickets_redis_seconds", "Redis round-trip duration", ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+TEMPLATE_SECONDS = Histogram("webtickets_template_render_seconds", "Template render time", ["template"])
+CACHE_REQUESTS = Counter("webtickets_cache_requests_total", "Cache lookups by result (hit ratio = hit / all)",
+    ["cache", "result"])
+SINGLE_FLIGHT = Counter("webtickets_single_flight_total", "Ticket loads by who ran the EWS query",
+    ["result"]) # leader, shared_process, shared_worker, fallback
+LIVE_EVENTS = Counter("webtickets_live_changes_total", "Ticket changes received from the EWS streaming subscription")
+CIRCUIT_OPENED = Counter("webtickets_ews_circuit_opened_total", "Times the EWS circuit breaker opened")
+STALE_RESPONSES = Counter("webtickets_stale_tickets_total", "Ticket lists served from the last known good copy",
+    ["cache"])
+# Set by live_stream, summed over the live workers under gunicorn
+LIVE_CONNECTIONS = Gauge("webtickets_live_connections", "Open live update streams", multiprocess_mode="livesum")
+
+# Counts a cache lookup
+def count_cache(sCache, bHit):
+    CACHE_REQUESTS.labels(sCache, "hit" if bHit else "miss").inc()
+
+# Redis client that records every round-trip (a pipeline counts as one, labeled PIPELINE)
+class InstrumentedRedis(Redis):
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            sCommand = str(args[0]).split(" ")[0].upper()
+            REDIS_SECONDS.labels(sCommand).observe(time.perf_counter() - start)
+            REDIS_CALLS.labels(sCommand).inc()
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        fnExecute = pipe.execute
+
+        def execute(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fnExecute(*args, **kwargs)
+            finally:
+                REDIS_SECONDS.labels("PIPELINE").observe(time.perf_counter() - start)
+                REDIS_CALLS.labels("PIPELINE").inc()
+
+        pipe.execute = execute
+        return pipe
 
-# Create instance of ClientApp
-webTicketsApp = ConfidentialClientApplication(client_id=m_sClientID, client_credential=m_sClientSecret, authority=m_sAuthority)
-
-########################
-# Flask Configuration
-########################
-
-# Create a Flask web application instance.
-app = Flask(__name__)
-
-# Generate a secret key
-secret_key = secrets.token_hex(16)
-
-# Create session secret key
-app.secret_key = secret_key
-
-# Sets the max session length to 30 minutes
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
+####################
+# Routes and Redis
+####################
 
-# Sets the session type to a redis type
-app.config['SESSION_TYPE'] = 'redis'
+# Routes and request hooks are registered on this blueprint, create_app() (at the bottom) builds the
+# Flask app around it. cli_group=None keeps the admin commands at the top level (flask invalidate-tickets).
+webTickets = Blueprint("webtickets", __name__, cli_group=None)
 
-# Use this line in testing.
-if TESTING_MODE == True:
-    r = Redis(host='localhost', port=6379, db=0)
-else:
+# Builds the redis client on first use (its pool only connects when a command is sent)
+@lru_cache(maxsize=None)
+def get_redis():
+    # Use this line in testing.
+    if TESTING_MODE == True:
+        return InstrumentedRedis(host='localhost', port=6379, db=0)
     # Use this line in production instead.
-    r = Redis(host=m_sHost, port=m_sPort, db=0)
+    return InstrumentedRedis(host=m_sHost, port=m_sPort, db=0)
+
+# Process-wide redis client, created by the first command sent through it
+r = LocalProxy(get_redis)
+
+# Sessions are stored as msgpack instead of pickle (smaller, and cheaper to load on every request).
+# Sessions written before the switch are pickles, and are still read so logged in users stay logged in.
+class CompactSessionSerializer:
+    def dumps(self, data):
+        return msgpack.packb(dict(data), use_bin_type=True)
+
+    def loads(self, data):
+        # Pickle protocol 2+ starts with 0x80 + protocol byte (a msgpack 0x80 is a lone empty map)
+        if data[:1] == b"\x80" and len(data) > 1:
+            return pickle.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+    # Newer flask_session versions call encode/decode
+    encode = dumps
+    decode = loads
+
+# Route latency, recorded for every request (registered first so it covers the other hooks)
+@webTickets.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@webTickets.after_app_request
+def record_request_latency(response):
+    if "request_start" in g:
+        sRoute = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.labels(sRoute, request.method, str(response.status_code)).observe(time.perf_counter() - g.request_start)
+    return response
+
+# Template render time, from Flask's render signals (connected in create_app)
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault("template_starts", {})[template.name] = time.perf_counter()
+
+def record_template_time(sender, template, context, **extra):
+    start = g.get("template_starts", {}).pop(template.name, None)
+    if start is not None:
+        TEMPLATE_SECONDS.labels(template.name).observe(time.perf_counter() - start)
 
-# Points to redis server session.
-app.config['SESSION_REDIS'] = r
+#########################
+# EWS Circuit Breaker
+#########################
 
-# Initialize Session
-Session(app)
+# Raised instead of calling EWS while the circuit is open
+class CircuitOpenError(Exception):
+    pass
+
+# Raised by run_concurrently when the EWS calls run past m_iEWSCallTimeout
+class EWSDeadlineError(Exception):
+    pass
+
+# EWS telling us to back off. With the shared retry policy (see ews_configuration) exchangelib waits
+# out ErrorServerBusy itself, and raises RateLimitError once the wait would go past EWS_MAX_WAIT.
+EWS_THROTTLE_ERRORS = (ErrorServerBusy, ErrorTooManyObjectsOpened, RateLimitError)
+
+# Errors the routes answer with the last known good tickets (flagged as stale) when there are some
+EWS_UNAVAILABLE_ERRORS = EWS_THROTTLE_ERRORS + (CircuitOpenError, EWSDeadlineError, ErrorTimeoutExpired, TransportError)
+
+# Shared by every worker through redis:
+#   webtickets:circuit:failures   throttled calls in the current CIRCUIT_FAILURE_WINDOW
+#   webtickets:circuit:open       set while the circuit is open (expires after the cooldown)
+#   webtickets:circuit:tripped    set from the circuit opening until a probe call gets through
+#   webtickets:circuit:probe      held by the worker making the probe call
+# Once CIRCUIT_FAILURE_THRESHOLD calls were throttled in the window, the circuit opens for
+# CIRCUIT_COOLDOWN seconds (or the back off EWS asked for, when that is longer), and EWS calls fail
+# right away instead of adding to the throttling. After the cooldown the circuit is half-open: one
+# call goes through as a probe while the others keep failing. The circuit closes when the probe
+# succeeds, and opens again when it is throttled.
+class CircuitBreaker:
+    # Longest the circuit stays open, whatever back off EWS asks for
+    MAX_OPEN = 300
+
+    def __init__(self, redis, prefix="webtickets:circuit:", threshold=5, window=60, cooldown=30, probe_timeout=30):
+        self.redis = redis
+        self.prefix = prefix
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+
+    def key(self, sName):
+        return self.prefix + sName
+
+    # Seconds until the circuit closes again (0 when it is closed)
+    def retry_after(self):
+        return max(0, self.redis.ttl(self.key("open")))
+
+    # Checks whether a call may go through. Returns "closed" (go ahead), "probe" (go ahead as the
+    # half-open probe, report back with end_probe) or "open" (fail right away)
+    def before_call(self):
+        sOpen, sTripped = self.redis.mget(self.key("open"), self.key("tripped"))
+        if sOpen is not None:
+            return "open"
+        if sTripped is None:
+            return "closed"
+        if self.redis.set(self.key("probe"), "1", nx=True, ex=self.probe_timeout):
+            return "probe"
+        # Another caller is probing
+        return "open"
+
+    # Closes the circuit after a successful probe, otherwise lets the next caller probe
+    def end_probe(self, bSucceeded):
+        if bSucceeded:
+            self.redis.delete(self.key("tripped"), self.key("failures"))
+            if TESTING_MODE == True:
+                print("EWS circuit closed")
+        self.redis.delete(self.key("probe"))
+
+    def open(self, iOpen):
+        if self.redis.set(self.key("open"), "1", nx=True, ex=iOpen):
+            self.redis.set(self.key("tripped"), "1")
+            self.redis.delete(self.key("failures"))
+            CIRCUIT_OPENED.inc()
+            if TESTING_MODE == True:
+                print("EWS circuit open for " + str(iOpen) + " seconds")
+
+    # Counts a throttled call, opening the circuit when there were too many in the window
+    # (or right away when the call was the half-open probe)
+    def record_throttle(self, back_off=None, bProbe=False):
+        iOpen = min(self.MAX_OPEN, max(self.cooldown, int(back_off or 0)))
+        if bProbe:
+            self.open(iOpen)
+            return
+
+        iFailures = self.redis.incr(self.key("failures"))
+        if iFailures == 1:
+            self.redis.expire(self.key("failures"), self.window)
+
+        if iFailures >= self.threshold or back_off is not None and back_off > self.cooldown:
+            self.open(iOpen)
+
+ewsCircuit = CircuitBreaker(r, threshold=m_iCircuitThreshold, window=m_iCircuitWindow, cooldown=m_iCircuitCooldown,\
+    probe_timeout=m_iEWSCallTimeout)
+
+# Deadline (time.monotonic) of the EWS call running on this thread, set by ews_call
+ewsDeadline = threading.local()
+
+# Exchangelib's FaultTolerance keeps retrying for as long as each back off EWS asks for is under
+# max_wait, so a busy server can hold a request for minutes. This one also gives up once the
+# back off would run past the deadline of the current ews_call (EWS_MAX_WAIT after it started).
+class BoundedFaultTolerance(FaultTolerance):
+    def back_off(self, seconds):
+        deadline = getattr(ewsDeadline, "value", None)
+        if deadline is not None and time.monotonic() + (seconds or self.DEFAULT_BACKOFF) > deadline:
+            raise RateLimitError("EWS wait budget used up", wait=seconds or self.DEFAULT_BACKOFF)
+        super().back_off(seconds)
+
+# Runs one EWS operation under the circuit breaker and the wait budget, and times it:
+# with ews_call("find_item"): ...
+@contextmanager
+def ews_call(sOperation):
+    # Nested calls (resolving the folder inside a query) keep the outer call's deadline, and went
+    # through the circuit breaker with it
+    previous_deadline = getattr(ewsDeadline, "value", None)
+    sCircuit = ewsCircuit.before_call() if previous_deadline is None else "closed"
+    if sCircuit == "open":
+        EWS_CALLS.labels(sOperation, "rejected").inc()
+        raise CircuitOpenError("EWS circuit is open")
+
+    start = time.perf_counter()
+    sOutcome = "error"
+    if previous_deadline is None:
+        ewsDeadline.value = time.monotonic() + m_iEWSMaxWait
+    try:
+        yield
+        sOutcome = "ok"
+    except EWS_THROTTLE_ERRORS as e:
+        sOutcome = "throttled"
+        # ErrorServerBusy carries the back off EWS asked for, RateLimitError the one it gave up on
+        ewsCircuit.record_throttle(getattr(e, "back_off", None) or getattr(e, "wait", None), sCircuit == "probe")
+        raise
+    finally:
+        if sCircuit == "probe":
+            ewsCircuit.end_probe(sOutcome == "ok")
+        ewsDeadline.value = previous_deadline
+        EWS_SECONDS.labels(sOperation).observe(time.perf_counter() - start)
+        EWS_CALLS.labels(sOperation, sOutcome).inc()
+
+# Requests that could not be answered at all while EWS is unavailable (no last known good data),
+# or whose EWS calls ran past their deadline (see run_concurrently). One handler per EWS_UNAVAILABLE_ERRORS.
+@webTickets.app_errorhandler(ErrorServerBusy)
+@webTickets.app_errorhandler(ErrorTooManyObjectsOpened)
+@webTickets.app_errorhandler(RateLimitError)
+@webTickets.app_errorhandler(CircuitOpenError)
+@webTickets.app_errorhandler(EWSDeadlineError)
+@webTickets.app_errorhandler(ErrorTimeoutExpired)
+@webTickets.app_errorhandler(TransportError)
+def ews_unavailable(e):
+    response = current_app.response_class("Exchange is busy right now, please try again in a minute.", status=503, mimetype="text/plain")
+    response.headers["Retry-After"] = str(ewsCircuit.retry_after() or m_iCircuitCooldown)
+    return response
 
 #######################
 # Extended Properties 
@@ -114,37 +417,1375 @@ class Reason(ExtendedProperty):
     property_name = '.Reason'
     property_type = 'String'
 
-# Register extended properties
-Task.register('dateCreated_property', DateCreated)
-Task.register('client_property', Client)
-Task.register('assignee_property', Assignee)
-Task.register('hrsActualTotal_property', HrsActualTotal)
-Task.register('datelastactivity_property', DateLastActivity)
-Task.register('reason_property', Reason)
+# Stamped on the time entries sent by the job workers, so a retry can tell whether an earlier
+# attempt already created the item (see run_time_entry_job)
+class TimeEntryJob(ExtendedProperty):
+    distinguished_property_set_id = 'PublicStrings'
+    property_name = '.TimeEntryJob'
+    property_type = 'String'
 
-##################
-#  / Root Path
-##################
-@app.route('/')
-def index():
-    # Checks for token in redis cache
-    if "access_token" in session:
+EXTENDED_PROPERTIES = (
+    (Task, 'dateCreated_property', DateCreated),
+    (Task, 'client_property', Client),
+    (Task, 'assignee_property', Assignee),
+    (Task, 'hrsActualTotal_property', HrsActualTotal),
+    (Task, 'datelastactivity_property', DateLastActivity),
+    (Task, 'reason_property', Reason),
+    (CalendarItem, 'timeEntryJob_property', TimeEntryJob),
+)
+
+# Register extended properties (from create_app, once per process)
+def register_extended_properties():
+    for cItem, sName, cProperty in EXTENDED_PROPERTIES:
+        try:
+            cItem.register(sName, cProperty)
+        except ValueError:
+            # Already registered by an earlier create_app()
+            pass
+
+#################
+# Account Pool
+#################
+
+# Exchangelib config for the passed credentials, pointed at EWS_SERVICE_ENDPOINT when set.
+# Every account gets the same retry policy: a throttled call is retried for at most EWS_MAX_WAIT
+# seconds, then fails with RateLimitError (and counts towards the EWS circuit breaker, see ews_call).
+def ews_configuration(creds):
+    if m_sEWSEndpoint:
+        return Configuration(service_endpoint=m_sEWSEndpoint, auth_type=OAUTH2, credentials=creds,\
+            retry_policy=BoundedFaultTolerance(max_wait=m_iEWSMaxWait))
+    return Configuration(server=m_sEWSServer, auth_type=OAUTH2, credentials=creds,\
+        retry_policy=BoundedFaultTolerance(max_wait=m_iEWSMaxWait))
+
+# Caches one exchangelib Account per user so the EWS connection pool (and its TLS session)
+# is reused between page loads instead of being rebuilt on every request.
+# Entries are keyed by session user key, and are evicted when the access token
+# expires or rotates, or when the pool grows past m_iAccountPoolSize (least recently used first).
+class AccountPool:
+    # Fallback token lifetime for token results without expires_in
+    DEFAULT_TOKEN_LIFETIME = 3600
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Fingerprint the access token so rotated tokens are detected without keeping a second copy
+    # (also the session's reference to the server-side token record)
+    @staticmethod
+    def fingerprint(token):
+        if isinstance(token, dict):
+            token = token.get("access_token", "")
+        return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+    # Release the HTTP sessions held by an evicted account.
+    # Exchangelib keeps every Protocol in a process-wide cache keyed by endpoint + credentials (so by
+    # access token), which would keep the evicted token's session pool alive; drop it from there too.
+    @staticmethod
+    def close(account):
+        try:
+            protocol = account.protocol
+            try:
+                if Protocol[protocol.config][0] is protocol:
+                    del Protocol[protocol.config]
+            except KeyError:
+                pass
+            protocol.close()
+        except Exception as e:
+            if TESTING_MODE == True:
+                print("Account pool close error: " + str(e))
+
+    # Build a new Account for the passed token
+    @staticmethod
+    def build(email, token):
         # Define Exchangelib creds.
-        creds = OAuth2AuthorizationCodeCredentials(access_token=session["access_token"])
-        if TESTING_MODE == True:
-            print("Token: " + str(session["access_token"]))
+        creds = OAuth2AuthorizationCodeCredentials(access_token=token)
 
         # Define Exchangelib config.
-        conf = Configuration(server="outlook.office365.com", auth_type=OAUTH2, credentials=creds)
+        conf = ews_configuration(creds)
 
         # Define the Exchangelib account, passing creds w/ access token
-        account = Account(
-            primary_smtp_address=session["email"],
+        return Account(
+            primary_smtp_address=email,
             access_type=DELEGATE,
             config=conf,
             autodiscover=False,
         )
 
+    # Returns a pooled Account for the user, building a new one on miss, expiry or token rotation.
+    # The token itself is only loaded (fnLoadToken) when a new Account has to be built.
+    def get(self, sUserKey, email, sFingerprint, fnLoadToken, expires_at=None):
+        key = sUserKey
+        now = time.time()
+        stale = []
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entryFingerprint, entryExpiresAt, account = entry
+                if entryFingerprint == sFingerprint and entryExpiresAt > now:
+                    # Hit: mark as most recently used
+                    self.entries.move_to_end(key)
+                    return account
+                # Token expired or rotated, drop the old account
+                del self.entries[key]
+                stale.append(account)
+
+        for account in stale:
+            self.close(account)
+
+        # Build outside the lock so one slow user doesn't block the others
+        account = self.build(email, fnLoadToken())
+        if expires_at is None:
+            expires_at = now + self.DEFAULT_TOKEN_LIFETIME
+
+        # (the accounts dropped above are already closed)
+        evictedAccounts = []
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                evictedAccounts.append(previous[2])
+            self.entries[key] = (sFingerprint, expires_at, account)
+            # Enforce the LRU size cap
+            while len(self.entries) > self.max_size:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                evictedAccounts.append(evicted)
+
+        for evicted in evictedAccounts:
+            # A concurrent build with the same token shares our Protocol, leave it open
+            if evicted.protocol is not account.protocol:
+                self.close(evicted)
+
+        return account
+
+# Process-wide account pool
+accountPool = AccountPool(m_iAccountPoolSize)
+
+################
+# User Tokens
+################
+
+# Each user's MSAL token cache (access + refresh token) is kept in redis, keyed by their
+# MSAL home account ID (session["user_key"]). When the access token in the session is about to
+# expire, a new one is fetched with acquire_token_silent (refresh token), so the user only goes
+# through the Microsoft login redirects again once the refresh token is gone.
+TOKEN_CACHE_PREFIX = "webtickets:msal:"
+
+# Shared between the per-request MSAL apps, so authority metadata is only fetched once per process
+msalHttpCache = {}
+
+# Loads the user's MSAL token cache from redis
+def load_token_cache(sUserKey):
+    cache = SerializableTokenCache()
+    if sUserKey:
+        cached = r.get(TOKEN_CACHE_PREFIX + sUserKey)
+        if cached is not None:
+            cache.deserialize(cached.decode())
+    return cache
+
+# Writes the user's MSAL token cache back to redis when MSAL changed it
+def save_token_cache(sUserKey, cache):
+    if cache.has_state_changed:
+        r.set(TOKEN_CACHE_PREFIX + sUserKey, cache.serialize(), ex=m_iTokenCacheTTL)
+
+# Builds an MSAL app working on the passed token cache
+def build_msal_app(cache):
+    return ConfidentialClientApplication(client_id=m_sClientID, client_credential=m_sClientSecret, authority=m_sAuthority,\
+        token_cache=cache, http_cache=msalHttpCache)
+
+# MSAL app for the login redirect, built on first use (building it fetches the authority's
+# metadata from Azure AD, so it is kept out of startup)
+@lru_cache(maxsize=None)
+def get_login_app():
+    return build_msal_app(None)
+
+# The access token itself lives server-side in redis (webtickets:token:<user key>); the session
+# only references it by fingerprint (token_ref) and keeps its expiry (token_exp)
+TOKEN_RECORD_PREFIX = "webtickets:token:"
+
+# Stores a token result server-side for the user, returns the stored token record
+def store_token_record(sUserKey, result, expires_at=None):
+    if expires_at is None:
+        expires_at = time.time() + int(result.get("expires_in", AccountPool.DEFAULT_TOKEN_LIFETIME))
+    token = {"access_token": result["access_token"], "token_type": "Bearer", "expires_at": expires_at}
+    r.set(TOKEN_RECORD_PREFIX + sUserKey, json.dumps(token), ex=max(1, int(expires_at - time.time())))
+    return token
+
+# Stores a token result server-side and references it from the session
+def store_session_token(result, expires_at=None):
+    token = store_token_record(session["user_key"], result, expires_at)
+
+    session["token_ref"] = AccountPool.fingerprint(token)
+    session["token_exp"] = int(token["expires_at"])
+
+# Redeems the user's refresh token. Returns the MSAL result, or None when the user has to log in again.
+def refresh_user_token(sUserKey, email):
+    cache = load_token_cache(sUserKey)
+    msalApp = build_msal_app(cache)
+    accounts = msalApp.get_accounts(username=email)
+    result = msalApp.acquire_token_silent(m_sScope, account=accounts[0]) if accounts else None
+    save_token_cache(sUserKey, cache)
+
+    if not result or "access_token" not in result:
+        return None
+    return result
+
+# Loads the server-side token record of the logged in user
+def load_session_token():
+    cached = r.get(TOKEN_RECORD_PREFIX + session["user_key"])
+    if cached is None:
+        return None
+    token = json.loads(cached)
+    if AccountPool.fingerprint(token) != session.get("token_ref"):
+        return None
+    return token
+
+# Migrates sessions from before the slim schema: the whole MSAL result held in session["access_token"]
+# moves to the server-side token record, and the session keeps only the reference
+@webTickets.before_app_request
+def migrate_session():
+    if "access_token" not in session:
+        return
+    result = session.pop("access_token")
+    expires_at = session.pop("token_expires_at", None)
+    if "user_key" not in session:
+        session["user_key"] = str(session.get("email", "")).lower()
+    if isinstance(result, dict) and "access_token" in result:
+        store_session_token(result, expires_at)
+
+# Makes sure the session references a usable access token, refreshing it silently when it is about to expire.
+# Returns False when the user has to log in again.
+def ensure_token():
+    if "token_ref" not in session:
+        return False
+
+    # Token still good
+    if session.get("token_exp", 0) - time.time() > m_iUserTokenMargin:
+        return True
+
+    # Redeem the refresh token
+    result = refresh_user_token(session["user_key"], session.get("email"))
+
+    if result is None:
+        # Refresh token is gone, the user has to log in again
+        session.pop("token_ref", None)
+        return False
+
+    store_session_token(result)
+    if TESTING_MODE == True:
+        print("Token refreshed for " + str(session.get("email")))
+    return True
+
+# Loads the token record for a new pooled Account; sends the user back through login when it is gone
+def load_session_token_or_login():
+    token = load_session_token()
+    if token is None:
+        session.pop("token_ref", None)
+        abort(redirect("/"))
+    return token
+
+# Returns the pooled Account for the logged in user
+def get_session_account():
+    return accountPool.get(session["user_key"], session["email"], session["token_ref"], load_session_token_or_login,\
+        session.get("token_exp"))
+
+# Returns the pooled Account for a user outside of a request (background jobs), refreshing the
+# stored token when it is about to expire. Returns None when the user has to log in again.
+def get_user_account(sUserKey, email):
+    cached = r.get(TOKEN_RECORD_PREFIX + sUserKey)
+    token = json.loads(cached) if cached is not None else None
+
+    if token is None or token["expires_at"] - time.time() <= m_iUserTokenMargin:
+        result = refresh_user_token(sUserKey, email)
+        if result is None:
+            return None
+        token = store_token_record(sUserKey, result)
+
+    return accountPool.get(sUserKey, email, AccountPool.fingerprint(token), lambda: token,\
+        token["expires_at"])
+
+##################
+# Service Account
+##################
+
+# One service account session per process, shared by the client portal and the background jobs.
+# The password-grant token is acquired once, shared between workers through redis, and replaced
+# m_iServiceTokenMargin seconds before it expires. The Account (and its connection pool) is kept
+# for as long as the token is.
+class ServiceAccountSession:
+    TOKEN_KEY = "webtickets:service:token"
+    TOKEN_LOCK_KEY = "webtickets:service:token:lock"
+
+    # Token requested for the service account (same permission as the staff logins)
+    SCOPE = ["https://outlook.office365.com/EWS.AccessAsUser.All"]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.msal = None
+        self.token = None
+        self.account = None
+
+    # True while the token has more than the refresh margin left
+    @staticmethod
+    def is_fresh(token):
+        return token is not None and token["expires_at"] - time.time() > m_iServiceTokenMargin
+
+    # Password-grant token acquisition against Azure AD
+    def acquire_token(self):
+        if self.msal is None:
+            self.msal = ConfidentialClientApplication(client_id=m_sClientID, client_credential=m_sClientSecret,\
+                authority="https://login.microsoftonline.com/" + str(m_sTenant))
+        result = self.msal.acquire_token_by_username_password(m_sEmail, m_sPassword, scopes=self.SCOPE)
+        if "access_token" not in result:
+            raise RuntimeError("Service account token error: " + str(result.get("error_description", result.get("error"))))
+        return {"access_token": result["access_token"], "token_type": "Bearer", "expires_at": time.time() + int(result["expires_in"])}
+
+    # Reads the shared token from redis
+    def read_shared_token(self):
+        cached = r.get(self.TOKEN_KEY)
+        if cached is not None:
+            token = json.loads(cached)
+            if self.is_fresh(token):
+                return token
+        return None
+
+    # Returns a fresh token, from redis when another worker already has one
+    def load_token(self):
+        token = self.read_shared_token()
+        if token is not None:
+            return token
+
+        # Only one worker acquires a new token, the others wait for it to show up in redis
+        if r.set(self.TOKEN_LOCK_KEY, "1", nx=True, ex=30):
+            try:
+                token = self.acquire_token()
+                r.set(self.TOKEN_KEY, json.dumps(token), ex=max(1, int(token["expires_at"] - time.time())))
+                return token
+            finally:
+                r.delete(self.TOKEN_LOCK_KEY)
+
+        for _ in range(50):
+            time.sleep(0.2)
+            token = self.read_shared_token()
+            if token is not None:
+                return token
+
+        # The worker holding the lock didn't deliver, get our own
+        return self.acquire_token()
+
+    # Returns the shared service Account, replacing it when its token is close to expiry
+    def get_account(self):
+        with self.lock:
+            if self.account is None or not self.is_fresh(self.token):
+                token = self.load_token()
+                if self.token is None or token["access_token"] != self.token["access_token"]:
+                    previous = self.account
+
+                    # Define Exchangelib creds.
+                    creds = OAuth2AuthorizationCodeCredentials(access_token=token)
+                    config = ews_configuration(creds)
+                    self.account = Account(m_sEmail, config=config, access_type=DELEGATE)
+
+                    if previous is not None:
+                        AccountPool.close(previous)
+                self.token = token
+            return self.account
+
+# Process-wide service account session
+serviceSession = ServiceAccountSession()
+
+# Returns the Exchangelib account for the service account (client portal and background jobs)
+def get_service_account():
+    return serviceSession.get_account()
+
+#################
+# EWS Executor
+#################
+
+# Bounded thread pool shared by the routes for running independent EWS calls concurrently
+ewsExecutor = ThreadPoolExecutor(max_workers=m_iEWSWorkers, thread_name_prefix="ews")
+
+# Runs each passed function on the EWS executor and returns their results in the same order.
+# The calls get m_iEWSCallTimeout seconds; running over raises EWSDeadlineError, which the routes
+# answer with a 503 (see ews_unavailable). The worker thread itself can't be interrupted, it finishes
+# in the background (and still fills the caches for the next request).
+def run_concurrently(*fns):
+    futures = [ewsExecutor.submit(fn) for fn in fns]
+    _, setPending = wait_futures(futures, timeout=m_iEWSCallTimeout, return_when=FIRST_EXCEPTION)
+    # A call that failed is raised as it is, in call order
+    for future in futures:
+        if future.done() and future.exception() is not None:
+            raise future.exception()
+    if setPending:
+        raise EWSDeadlineError("EWS calls ran past " + str(m_iEWSCallTimeout) + " seconds")
+    return [future.result() for future in futures]
+
+###################
+# Tickets Folder
+###################
+
+# Walks "All Public Folders" down to the configured tickets folder.
+# This costs a GetFolder/FindFolder round-trip per level, so the result is cached below.
+def resolve_tickets_folder(account):
+    # Traverse to our public folders root. "All Public Folders"
+    fFolder = account.public_folders_root
+
+    # Traverse to the tickets folder, one level at a time
+    with ews_call("resolve_folder"):
+        for sPart in m_sTicketsFolder.split('/'):
+            fFolder = fFolder / sPart
+
+    return fFolder
+
+# Returns the tickets folder, using the ID and change key cached in redis when available
+# so FindItem can go straight to the folder.
+def get_tickets_folder(account, refresh=False):
+    sKey = "webtickets:folder:" + m_sTicketsFolder
+
+    if not refresh:
+        cached = r.get(sKey)
+        count_cache("folder", cached is not None)
+        if cached is not None:
+            folder_ref = json.loads(cached)
+            return Tasks(root=account.public_folders_root, id=folder_ref["id"], changekey=folder_ref["changekey"])
+
+    # Cache miss (or forced refresh): walk the folder path and store the result
+    cTasks = resolve_tickets_folder(account)
+    r.set(sKey, json.dumps({"id": cTasks.id, "changekey": cTasks.changekey}), ex=m_iFolderCacheTTL)
+    return cTasks
+
+# Runs a query against the tickets folder and returns the results as a list.
+# fnQuery receives the folder and returns a QuerySet.
+# If EWS reports the cached folder is gone, the path is resolved again and the query retried once.
+def query_tickets(account, fnQuery):
+    try:
+        with ews_call("find_item"):
+            return list(fnQuery(get_tickets_folder(account)))
+    except ErrorFolderNotFound:
+        if TESTING_MODE == True:
+            print("Tickets folder not found, re-resolving " + m_sTicketsFolder)
+        cTasks = get_tickets_folder(account, refresh=True)
+        with ews_call("find_item"):
+            return list(fnQuery(cTasks))
+
+##################
+# Ticket Record
+##################
+
+# US/Eastern accounts for DST and Standard Time Transitions
+EASTERN_TZ = pytz.timezone('US/Eastern')
+
+# Date formats shown on the ticket tables and the time entry panel
+TICKET_DATE_FORMAT = '%Y-%m-%d %I:%M %p'
+EVENT_DATE_FORMAT = '%m/%d/%Y %I:%M %p'
+
+# Converts a UTC timestamp to Eastern time and formats it.
+# Memoized: tickets share a lot of timestamps (bulk imports, same-minute activity).
+@lru_cache(maxsize=8192)
+def format_eastern(dt, sFormat=TICKET_DATE_FORMAT):
+    if dt is None:
+        return ""
+    return dt.astimezone(EASTERN_TZ).strftime(sFormat)
+
+# One row of a ticket table.
+# Templates read it like the old ticket dicts: task.Subject, task.Category, task['Date Created'], ...
+class Ticket:
+    __slots__ = ("id", "changekey", "subject", "categories", "date_created", "hours", "last_activity")
+
+    # Template keys -> attributes
+    KEYS = {
+        'Subject': "subject",
+        'Category': "categories",
+        'Date Created': "date_created",
+        'Hours (Actual)': "hours",
+        'Last Activity': "last_activity",
+    }
+
+    def __init__(self, id, changekey, subject, categories, date_created, hours, last_activity):
+        self.id = id
+        self.changekey = changekey
+        self.subject = subject
+        self.categories = categories
+        self.date_created = date_created
+        self.hours = hours
+        self.last_activity = last_activity
+
+    def __getitem__(self, key):
+        return getattr(self, self.KEYS[key])
+
+    # Builds the row from an exchangelib Task (or a mirrored ticket), formatting the dates in Eastern time.
+    # Hours come back from EWS as a Decimal, kept as its string so the row stays JSON serializable
+    # (and renders the same as before)
+    @classmethod
+    def from_task(cls, task):
+        hours = task.hrsActualTotal_property
+        return cls(task.id, task.changekey, task.subject, task.categories,
+                   format_eastern(task.dateCreated_property), None if hours is None else str(hours),
+                   format_eastern(task.datelastactivity_property))
+
+    # Form used by the JSON API
+    def to_json(self):
+        return {
+            "id": self.id,
+            "changekey": self.changekey,
+            "subject": self.subject,
+            "categories": self.categories,
+            "date_created": self.date_created,
+            "hours": self.hours,
+            "last_activity": self.last_activity,
+        }
+
+    # Compact form for the redis caches: a plain list in __slots__ order
+    def to_row(self):
+        return [self.id, self.changekey, self.subject, self.categories, self.date_created, self.hours, self.last_activity]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+# Projects tasks into Ticket records in a single pass, keeping only those fnKeep accepts
+def project_tickets(tasks, fnKeep=None):
+    listTickets = []
+    for task in tasks:
+        if TESTING_MODE == True:
+            print("Ticket Subject: ", task.subject)
+        if fnKeep is None or fnKeep(task):
+            listTickets.append(Ticket.from_task(task))
+    return listTickets
+
+# Serializes Ticket records for redis
+def dump_ticket_rows(listTickets):
+    return json.dumps([ticket.to_row() for ticket in listTickets])
+
+# Reads Ticket records back from redis
+def parse_ticket_rows(data):
+    return [Ticket.from_row(row) for row in json.loads(data)]
+
+###################
+# Ticket Loaders
+###################
+
+# Server-side restrictions, so EWS doesn't send the tickets we would throw away.
+# EWS tests a restriction on a multi-valued property (Categories) against each value, and a
+# restriction on a missing property is false. So ~Q(categories__contains=[X]) (IsNotEqualTo) keeps
+# the tickets with any category other than X, and the tickets without categories have to be ORed
+# back in. The exact checks below still run on the results (and on the local mirror).
+
+# Tickets without any category
+NO_CATEGORIES = ~Q(categories__exists=True)
+
+# Leaves out the tickets in 'Review' category
+REVIEW_EXCLUDED = ~Q(categories__contains=["9 REVIEW"]) | NO_CATEGORIES
+
+# Only the tickets in 'Place Holder' category (may still carry other categories, see load_placeholder_tickets)
+PLACEHOLDER_ONLY = Q(categories__contains=["Place Holder"])
+
+# Client portal: only "Support" or "Billable" reason, leaving out the tickets in '9 REVIEW' or
+# '8 Time' categories and the tickets with "-2DEL-" in subject
+CLIENT_PORTAL_RESTRICTION = (Q(reason_property__exact="Support") | Q(reason_property__exact="Billable")) &\
+    REVIEW_EXCLUDED & (~Q(categories__contains=["8 Time"]) | NO_CATEGORIES) & ~Q(subject__contains="-2DEL-")
+
+# Checks if a ticket is in 'Review' category (and no other)
+def ticket_in_review(task):
+    return task.categories == ["9 REVIEW"]
+
+# Checks if a ticket may show on the client portal (the reason is checked by the callers, it isn't
+# fetched from EWS): not only in '9 REVIEW' or '8 Time' category, no "-2DEL-" in subject, and no "#"
+# after clientID + ticket number (EWS can't restrict on a character position)
+def ticket_on_portal(task):
+    return task.categories != ["9 REVIEW"] and task.categories != ["8 Time"] and "-2DEL-" not in task.subject\
+        and task.subject[12] != '#'
+
+# Display order of the staff ticket lists (last activity at the top)
+# Requested from EWS directly, so that paging offsets line up with what is shown
+TICKET_ORDER = ('-client_property', 'dateCreated_property')
+
+# Slices a QuerySet to one page; exchangelib sends the slice as the FindItem offset and max items
+def page_query(qs, iOffset, iLimit):
+    if iLimit is None:
+        return qs
+    return qs[iOffset:iOffset + iLimit]
+
+# Loads the tickets matching the passed filter (e.g. assignee_property__exact=assigneeID),
+# leaving out the tickets in 'Review' category.
+# iOffset/iLimit select a page, which EWS applies as the FindItem offset and max items.
+def load_tickets(account, iOffset=0, iLimit=None, **kwargs):
+    # Sort the tasks by the passed filter (from the local mirror when it is up to date)
+    if mirror_ready():
+        listSortedTickets = [task for task in query_mirror(order_by=TICKET_ORDER, **kwargs) if not ticket_in_review(task)]
+        listSortedTickets = page_query(listSortedTickets, iOffset, iLimit)
+    else:
+        listSortedTickets = query_tickets(account, lambda cTasks: page_query(cTasks.filter(REVIEW_EXCLUDED, **kwargs).order_by(*TICKET_ORDER)\
+            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property"), iOffset, iLimit))
+
+    # Project the tasks into Ticket records, filtering out the tickets in 'Review' category
+    return project_tickets(listSortedTickets, lambda task: not ticket_in_review(task))
+
+# Loads the unassigned tickets in 'Place Holder' category
+def load_placeholder_tickets(account):
+    # Sort the tasks by assigneeID as none, in 'Place Holder' category (from the local mirror when it is up to date)
+    if mirror_ready():
+        listSortedTicketsNone = query_mirror(assignee_property__exact="")
+    else:
+        listSortedTicketsNone = query_tickets(account, lambda cTasks: cTasks.filter(PLACEHOLDER_ONLY, assignee_property__exact="").order_by('client_property', '-dateCreated_property')\
+            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property"))
+
+    # Add tasks to listTicketsNone (reversed so that last activity is at the top)
+    # Filter for tickets only in 'Place Holder' category
+    # (EWS can only restrict on containing the category, not on it being the only one)
+    return project_tickets(reversed(listSortedTicketsNone), lambda task: task.categories == ["Place Holder"])
+
+# Loads the tickets shown on the client portal for clientID
+def load_client_portal_tickets(account, clientID):
+    # Sort the tasks by passed clientID
+    # Only requests tasks in "Support" or "Billable" reason, outside of '9 REVIEW' and '8 Time' categories
+    # and without "-2DEL-" in subject
+    if mirror_ready():
+        listSortedTickets = [task for task in query_mirror(order_by=('-dateCreated_property',), client_property__exact=clientID)\
+            if task.reason_property in ("Support", "Billable")]
+    else:
+        listSortedTickets = query_tickets(account, lambda cTasks: cTasks.filter(
+        Q(client_property__exact=clientID) & CLIENT_PORTAL_RESTRICTION).order_by('-dateCreated_property').only("subject", "categories", "dateCreated_property",\
+            "hrsActualTotal_property", "datelastactivity_property"))
+
+    # Traverse through the listSortedTickets (reversed so that last activity is at the top)
+    # Filter out the tickets in '9 Review', "8 Time", categories, with "-2DEL-" in subject
+    # or with "#" after clientID + ticket number
+    return project_tickets(reversed(listSortedTickets), ticket_on_portal)
+
+#####################
+# Last Known Good
+#####################
+
+# Every ticket list loaded from EWS is also kept for LAST_GOOD_TTL seconds under
+#   webtickets:lastgood:<result key>
+# When EWS is throttling us (or the circuit breaker is open), that copy is served instead,
+# flagged as stale so the templates can say so.
+LAST_GOOD_PREFIX = "webtickets:lastgood:"
+
+# Ticket list read from the last known good copy instead of EWS
+class StaleTickets(list):
+    pass
+
+# Keeps a copy of freshly loaded tickets
+def store_last_good(sKey, listTickets):
+    r.set(LAST_GOOD_PREFIX + sKey, dump_ticket_rows(listTickets), ex=m_iLastGoodTTL)
+
+# Runs fnLoad, keeping a copy of its result. If EWS is unavailable, returns the last known good
+# copy as StaleTickets instead (raising the EWS error when there is none).
+def load_or_last_good(sKey, fnLoad):
+    try:
+        listTickets = fnLoad()
+    except EWS_UNAVAILABLE_ERRORS as e:
+        cached = r.get(LAST_GOOD_PREFIX + sKey)
+        if cached is None:
+            raise
+        if TESTING_MODE == True:
+            print("Serving last known good tickets for " + sKey + ": " + str(e))
+        STALE_RESPONSES.labels(sKey[len(TICKET_CACHE_PREFIX):].split(":")[0]).inc()
+        return StaleTickets(parse_ticket_rows(cached))
+
+    store_last_good(sKey, listTickets)
+    return listTickets
+
+#################
+# Single Flight
+#################
+
+# Identical queries running at the same time share one EWS call and its result:
+# - in the process, later callers wait on the first caller's flight
+# - across workers, the first caller takes webtickets:flight:<result key> (SET NX) and writes the
+#   rows to the result key; the other workers poll the result key until it shows up
+# If the leader dies or takes longer than EWS_CALL_TIMEOUT, the waiters run the query themselves.
+SINGLE_FLIGHT_PREFIX = "webtickets:flight:"
+SINGLE_FLIGHT_POLL = 0.05
+
+# In-process flights: result key -> SimpleNamespace(done, result, error)
+flights = {}
+flightsLock = threading.Lock()
+
+# Returns the result stored under sKey, or runs fnLoad once for everybody asking for sKey at the
+# same time and stores its result under sKey for iResultTTL seconds.
+# Results are stored with fnDump and read back with fnParse (ticket rows by default).
+def single_flight(sKey, fnLoad, iResultTTL, fnDump=dump_ticket_rows, fnParse=parse_ticket_rows):
+    with flightsLock:
+        flight = flights.get(sKey)
+        bLeader = flight is None
+        if bLeader:
+            flight = flights[sKey] = SimpleNamespace(done=threading.Event(), result=None, error=None)
+
+    if not bLeader:
+        if flight.done.wait(m_iEWSCallTimeout):
+            SINGLE_FLIGHT.labels("shared_process").inc()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        # Leader is stuck, don't hold this request hostage
+        SINGLE_FLIGHT.labels("fallback").inc()
+        return fnLoad()
+
+    try:
+        flight.result = load_across_workers(sKey, fnLoad, iResultTTL, fnDump, fnParse)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with flightsLock:
+            flights.pop(sKey, None)
+        flight.done.set()
+
+# Cross-worker half of single_flight: one worker loads, the others wait for its result key
+def load_across_workers(sKey, fnLoad, iResultTTL, fnDump, fnParse):
+    sLockKey = SINGLE_FLIGHT_PREFIX + sKey
+    sFlightID = uuid.uuid4().hex
+
+    if r.set(sLockKey, sFlightID, nx=True, ex=m_iEWSCallTimeout):
+        try:
+            SINGLE_FLIGHT.labels("leader").inc()
+            result = fnLoad()
+            store_flight_result(sKey, result, iResultTTL, fnDump)
+            return result
+        finally:
+            # Only release our own lock (it may have expired and been taken by now)
+            if r.get(sLockKey) == sFlightID.encode():
+                r.delete(sLockKey)
+
+    # Another worker is running the query, wait for its result
+    deadline = time.monotonic() + m_iEWSCallTimeout
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL)
+        cached = r.get(sKey)
+        if cached is not None:
+            SINGLE_FLIGHT.labels("shared_worker").inc()
+            return fnParse(cached)
+        if not r.exists(sLockKey):
+            # Leader gave up without a result (EWS error), try ourselves
+            break
+
+    SINGLE_FLIGHT.labels("fallback").inc()
+    result = fnLoad()
+    store_flight_result(sKey, result, iResultTTL, fnDump)
+    return result
+
+# Stores a flight's result for the other callers. Stale tickets aren't stored, so the next request
+# goes back to EWS (the circuit breaker keeps that cheap while EWS is unavailable).
+def store_flight_result(sKey, result, iResultTTL, fnDump):
+    if not isinstance(result, StaleTickets):
+        r.set(sKey, fnDump(result), ex=iResultTTL)
+
+#################
+# Ticket Cache
+#################
+
+# Ticket lists are cached in redis per query, e.g.
+#   webtickets:tickets:assignee:tb
+#   webtickets:tickets:client:ABC
+#   webtickets:tickets:placeholder:
+TICKET_CACHE_PREFIX = "webtickets:tickets:"
+
+def ticket_cache_key(sKind, sValue):
+    return TICKET_CACHE_PREFIX + sKind + ":" + sValue
+
+# Returns the projected ticket rows for the query, calling fnLoad (and caching its result
+# for m_iTicketCacheTTL seconds) on a miss
+def get_cached_tickets(sKind, sValue, fnLoad):
+    sKey = ticket_cache_key(sKind, sValue)
+
+    cached = r.get(sKey)
+    count_cache("tickets:" + sKind, cached is not None)
+    if cached is not None:
+        return parse_ticket_rows(cached)
+
+    # Concurrent misses for the same query share one load
+    # (the last known good rows while EWS is unavailable)
+    return single_flight(sKey, lambda: load_or_last_good(sKey, fnLoad), m_iTicketCacheTTL)
+
+# Client portal tickets. Not cached (clients expect what they see to be current), but identical
+# requests arriving together share one query, kept for SINGLE_FLIGHT_RESULT_TTL seconds.
+def get_client_portal_tickets(account, clientID):
+    sKey = ticket_cache_key("portal", clientID)
+
+    cached = r.get(sKey)
+    count_cache("tickets:portal", cached is not None)
+    if cached is not None:
+        return parse_ticket_rows(cached)
+
+    return single_flight(sKey, lambda: load_or_last_good(sKey, lambda: load_client_portal_tickets(account, clientID)),\
+        m_iSingleFlightResultTTL)
+
+# Drops cached ticket lists.
+# Passing a kind and value drops that one query, passing only a kind drops every query
+# of that kind, passing nothing drops every cached ticket list.
+def invalidate_ticket_cache(sKind=None, sValue=None):
+    if sKind is not None and sValue is not None:
+        # Also drop the cached pages of that query (<key>:<page>:<page size>)
+        r.delete(ticket_cache_key(sKind, sValue))
+        sPattern = ticket_cache_key(sKind, sValue) + ":*"
+    elif sKind is not None:
+        sPattern = TICKET_CACHE_PREFIX + sKind + ":*"
+    else:
+        sPattern = TICKET_CACHE_PREFIX + "*"
+
+    listKeys = list(r.scan_iter(match=sPattern))
+    if listKeys:
+        r.delete(*listKeys)
+
+# Admin command: flask --app app invalidate-tickets [assignee|client|placeholder] [ID]
+@webTickets.cli.command("invalidate-tickets")
+@click.argument("kind", required=False)
+@click.argument("value", required=False)
+def invalidate_tickets_command(kind, value):
+    # IDs are stored the same way the routes normalize them
+    if value is not None:
+        value = value.upper() if kind == "client" else value.lower()
+    invalidate_ticket_cache(kind, value)
+    click.echo("Ticket cache cleared.")
+
+#################
+# Ticket Paging
+#################
+
+# Largest page a client may ask for
+MAX_PAGE_SIZE = 1000
+
+# Reads the paging parameters: ?page=<n>&page_size=<rows>
+# Returns (page, page size), with page size None when the full list was asked for
+def get_page_args():
+    if "page" not in request.args and "page_size" not in request.args:
+        return 1, None
+    iPage = max(1, request.args.get("page", 1, type=int))
+    iPageSize = min(max(1, request.args.get("page_size", m_iTicketPageSize, type=int)), MAX_PAGE_SIZE)
+    return iPage, iPageSize
+
+# Checks for ?stream=1
+def is_stream_request():
+    return request.args.get("stream") == "1"
+
+# Yields the tickets page by page, followed by the 'Place Holder' tickets,
+# so the first rows are rendered while later pages are still being fetched
+def stream_tickets(account, **kwargs):
+    iOffset = 0
+    while True:
+        listPage = load_tickets(account, iOffset=iOffset, iLimit=m_iTicketPageSize, **kwargs)
+        yield from listPage
+        if len(listPage) < m_iTicketPageSize:
+            break
+        iOffset += m_iTicketPageSize
+    yield from get_placeholder_tickets(account)
+
+# Returns the ticket rows for a staff ticket list, the paging values for the template and the
+# results of fnsExtra (other independent EWS calls the route needs, run at the same time):
+# - default: the full list (cached) followed by the 'Place Holder' tickets
+# - ?page=<n>&page_size=<rows>: one page (cached per page), 'Place Holder' tickets on the last page
+# - ?stream=1: a generator fetching the list page by page (see stream_tickets)
+# The paging values also carry "stale", set when the tickets came from the last known good copy.
+def get_ticket_rows(sKind, sValue, account, *fnsExtra, **kwargs):
+    iPage, iPageSize = get_page_args()
+    dictPaging = {"page": iPage, "page_size": iPageSize, "has_next": False, "stale": False}
+
+    if is_stream_request():
+        return stream_tickets(account, **kwargs), dictPaging, run_concurrently(*fnsExtra)
+
+    if iPageSize is None:
+        # Get the full list and the unassigned tickets in 'Place Holder' category (shared snapshot)
+        listTickets, listTicketsNone, *listExtra = run_concurrently(
+            lambda: get_cached_tickets(sKind, sValue, lambda: load_tickets(account, **kwargs)),
+            lambda: get_placeholder_tickets(account),
+            *fnsExtra
+        )
+        dictPaging["stale"] = isinstance(listTickets, StaleTickets) or isinstance(listTicketsNone, StaleTickets)
+        return listTickets + listTicketsNone, dictPaging, listExtra
+
+    # Get one more row than the page holds, to know if there is a next page
+    sPageKey = sValue + ":" + str(iPage) + ":" + str(iPageSize)
+    listTickets, listTicketsNone, *listExtra = run_concurrently(
+        lambda: get_cached_tickets(sKind, sPageKey, lambda: load_tickets(account, iOffset=(iPage - 1) * iPageSize, iLimit=iPageSize + 1, **kwargs)),
+        lambda: get_placeholder_tickets(account),
+        *fnsExtra
+    )
+    dictPaging["stale"] = isinstance(listTickets, StaleTickets) or isinstance(listTicketsNone, StaleTickets)
+    dictPaging["has_next"] = len(listTickets) > iPageSize
+    listTickets = listTickets[:iPageSize]
+
+    # 'Place Holder' tickets follow the list, so they go on the last page
+    if not dictPaging["has_next"]:
+        listTickets = listTickets + listTicketsNone
+    return listTickets, dictPaging, listExtra
+
+##########################
+# Conditional Responses
+##########################
+
+# Strong ETag for a ticket list: a hash of the item IDs and change keys (a change key changes
+# whenever its ticket does) plus whatever else ends up in the response body
+def ticket_etag(listTickets, *extra):
+    sha = hashlib.sha256()
+    for ticket in listTickets:
+        sha.update((ticket.id or "").encode())
+        sha.update(b"\0")
+        sha.update((ticket.changekey or "").encode())
+        sha.update(b"\n")
+    for value in extra:
+        sha.update(repr(value).encode())
+    return sha.hexdigest()
+
+# Answers If-None-Match with 304 (without calling fnRender), otherwise returns fnRender()'s
+# response, either way carrying the ETag. Clients must revalidate before reusing the response.
+def respond_with_etag(sETag, fnRender, bPrivate=True):
+    if request.if_none_match.contains(sETag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(fnRender())
+    response.set_etag(sETag)
+    response.headers["Cache-Control"] = ("private" if bPrivate else "public") + ", no-cache"
+    return response
+
+# Template context left out of the HTML ETags: the tickets are hashed by ID and change key, and
+# currentime (the time entry form's default start, changes every minute) would keep the ETag from
+# ever matching
+ETAG_IGNORED_CONTEXT = ("tasks", "currentime")
+
+# Renders a ticket list template, streamed when ?stream=1 was asked for,
+# otherwise with an ETag covering the tickets, the paging and the rest of the template context
+def render_tickets(sTemplate, bPrivate=True, **context):
+    if is_stream_request():
+        return current_app.response_class(stream_template(sTemplate, **context))
+
+    listOther = sorted((key, value) for key, value in context.items() if key not in ETAG_IGNORED_CONTEXT)
+    sETag = ticket_etag(context["tasks"], sTemplate, listOther)
+    return respond_with_etag(sETag, lambda: render_template(sTemplate, **context), bPrivate)
+
+# Returns ticket rows as JSON, with an ETag covering the tickets and the other fields
+def json_tickets(listTickets, bPrivate=True, **fields):
+    sETag = ticket_etag(listTickets, "json", sorted(fields.items()))
+    return respond_with_etag(sETag, lambda: jsonify(tickets=[ticket.to_json() for ticket in listTickets], **fields), bPrivate)
+
+#######################
+# Client Portal Cache
+#######################
+
+# The rendered client portal page is cached per client ID:
+#   webtickets:portal:page:<client ID>      JSON {"html", "etag", "rendered_at"}
+# For m_iPortalFreshTTL seconds the page is served as is. For m_iPortalStaleTTL seconds after that
+# it is still served right away, while one background refresh renders a new one.
+PORTAL_PAGE_PREFIX = "webtickets:portal:page:"
+PORTAL_REFRESH_PREFIX = "webtickets:portal:refresh:"
+
+# Queries and renders the client portal page
+def render_client_portal(clientID):
+    # Get the shared Exchangelib account for the service account
+    account = get_service_account()
+
+    # Get the tickets shown to the client
+    listTickets = get_client_portal_tickets(account, clientID)
+    bStale = isinstance(listTickets, StaleTickets)
+
+    dictPage = {
+        "html": render_template('task_list_client.html', clientID=clientID, tasks=listTickets, stale=bStale),
+        "etag": ticket_etag(listTickets, 'task_list_client.html', [("clientID", clientID), ("stale", bStale)]),
+        # A stale page counts as expired, so the next request tries to refresh it
+        "rendered_at": 0 if bStale else time.time()
+    }
+    r.set(PORTAL_PAGE_PREFIX + clientID, json.dumps(dictPage), ex=m_iPortalFreshTTL + m_iPortalStaleTTL)
+    return dictPage
+
+# Renders a new page in the background, unless another request (or worker) already is
+def refresh_client_portal(clientID):
+    if not r.set(PORTAL_REFRESH_PREFIX + clientID, "1", nx=True, ex=m_iEWSCallTimeout):
+        return
+
+    # Runs after this request is done, so it gets a copy of the request context for rendering
+    @copy_current_request_context
+    def refresh():
+        try:
+            render_client_portal(clientID)
+        except Exception as e:
+            print("Client portal refresh error: " + str(e))
+        finally:
+            r.delete(PORTAL_REFRESH_PREFIX + clientID)
+
+    ewsExecutor.submit(refresh)
+
+# Returns the client portal page, from the cache when there is one (refreshing it in the background
+# when it is stale)
+def get_client_portal_page(clientID):
+    cached = r.get(PORTAL_PAGE_PREFIX + clientID)
+    count_cache("portal_page", cached is not None)
+    if cached is None:
+        return render_client_portal(clientID)
+
+    dictPage = json.loads(cached)
+    if time.time() - dictPage["rendered_at"] > m_iPortalFreshTTL:
+        refresh_client_portal(clientID)
+    return dictPage
+
+# Drops the cached portal page of a client
+def invalidate_client_portal(clientID):
+    r.delete(PORTAL_PAGE_PREFIX + clientID)
+
+#################
+# Rate Limiting
+#################
+
+RATE_LIMIT_PREFIX = "webtickets:ratelimit:"
+
+# Counts a request against a fixed one minute window.
+# Returns the seconds until the window resets when sName is over iLimit, otherwise 0.
+def rate_limited(sName, iLimit):
+    iWindow = int(time.time() // 60)
+    sKey = RATE_LIMIT_PREFIX + sName + ":" + str(iWindow)
+
+    pipe = r.pipeline()
+    pipe.incr(sKey)
+    pipe.expire(sKey, 60)
+    iCount = pipe.execute()[0]
+
+    if iCount > iLimit:
+        return max(1, (iWindow + 1) * 60 - int(time.time()))
+    return 0
+
+# 429 response when the client portal is hit too often for the client ID or from the remote address,
+# otherwise None. request.remote_addr is the client's address once create_app has applied ProxyFix
+# (PROXY_FIX_X_FOR); the per-IP limit is skipped when the number of proxies isn't set.
+def limit_client_portal(clientID):
+    iRetryAfter = rate_limited("portal:client:" + clientID, m_iPortalClientRate)
+    if not iRetryAfter and current_app.config['PROXY_FIX_X_FOR'] is not None:
+        iRetryAfter = rate_limited("portal:ip:" + str(request.remote_addr), m_iPortalIPRate)
+    if not iRetryAfter:
+        return None
+
+    response = current_app.response_class("Too many requests, please try again in a minute.", status=429, mimetype="text/plain")
+    response.headers["Retry-After"] = str(iRetryAfter)
+    return response
+
+#################################
+# Place Holder Snapshot
+#################################
+
+# The unassigned 'Place Holder' tickets are the same for every user, so one background refresher
+# keeps a snapshot of them in the "placeholder" ticket cache entry.
+# Every worker process runs a refresher thread, but only the one holding the redis leader lock
+# queries EWS; the others just keep checking whether the leader went away.
+PLACEHOLDER_LEADER_KEY = "webtickets:placeholder:leader"
+
+# Snapshot outlives a few missed refreshes before routes fall back to querying EWS themselves
+PLACEHOLDER_SNAPSHOT_TTL = m_iPlaceholderRefresh * 4
+
+
+# Returns the 'Place Holder' tickets from the snapshot.
+# If there is no snapshot yet, the tickets are loaded with the passed account and cached as usual.
+def get_placeholder_tickets(account):
+    return get_cached_tickets("placeholder", "", lambda: load_placeholder_tickets(account))
+
+# Takes the leader lock if it is free, or extends it if sWorkerID already holds it.
+# Returns True while sWorkerID is the leader.
+def hold_leader_lock(sKey, sWorkerID, iTTL):
+    if r.set(sKey, sWorkerID, nx=True, ex=iTTL):
+        return True
+    if r.get(sKey) == sWorkerID.encode():
+        return bool(r.expire(sKey, iTTL))
+    return False
+
+# Refresher loop: take (or keep) the leader lock, and refresh the snapshot while we hold it
+def refresh_placeholder_snapshot():
+    sWorkerID = uuid.uuid4().hex
+
+    while True:
+        try:
+            if hold_leader_lock(PLACEHOLDER_LEADER_KEY, sWorkerID, PLACEHOLDER_SNAPSHOT_TTL):
+                serviceAccount = get_service_account()
+                listTicketsNone = load_placeholder_tickets(serviceAccount)
+                r.set(ticket_cache_key("placeholder", ""), dump_ticket_rows(listTicketsNone), ex=PLACEHOLDER_SNAPSHOT_TTL)
+                store_last_good(ticket_cache_key("placeholder", ""), listTicketsNone)
+                if TESTING_MODE == True:
+                    print("Place Holder snapshot refreshed: " + str(len(listTicketsNone)) + " tickets")
+        except Exception as e:
+            # Keep the refresher alive, the routes fall back to EWS while the snapshot is missing
+            print("Place Holder refresh error: " + str(e))
+
+        time.sleep(m_iPlaceholderRefresh)
+
+#################
+# Ticket Mirror
+#################
+
+# With MIRROR_ENABLED, a background sync keeps a local copy of the tickets folder in redis
+# (see ticket_mirror.py) and the ticket loaders read from it instead of running FindItem.
+ticketMirror = TicketMirror(r)
+
+MIRROR_LEADER_KEY = "webtickets:mirror:leader"
+
+# Mirror is only trusted while the sync loop is keeping up
+MIRROR_MAX_AGE = m_iMirrorSyncInterval * 4
+
+# Maps the load_tickets filters onto the mirror indexes
+MIRROR_FILTERS = {"client_property__exact": "client", "assignee_property__exact": "assignee"}
+
+# True when the routes can be answered from the mirror
+def mirror_ready():
+    if not m_bMirrorEnabled or not ticketMirror.is_ready():
+        return False
+    age = ticketMirror.age()
+    return age is not None and age < MIRROR_MAX_AGE
+
+# Returns mirrored tickets matching the passed filters, as task-like objects sorted the same way
+# as the EWS order_by(...) would
+def query_mirror(order_by=('client_property', '-dateCreated_property'), **kwargs):
+    listRows = ticketMirror.query(**{MIRROR_FILTERS[k]: v for k, v in kwargs.items()})
+
+    listTasks = []
+    for row in listRows:
+        for sField in MIRROR_DATE_FIELDS:
+            if row[sField] is not None:
+                row[sField] = datetime.fromisoformat(row[sField])
+        listTasks.append(SimpleNamespace(**row))
+
+    # Apply the sort keys last to first (list.sort is stable)
+    for sField in reversed(order_by):
+        bDescending = sField.startswith('-')
+        sField = sField.lstrip('-')
+        listTasks.sort(key=lambda task: (getattr(task, sField) is not None, getattr(task, sField)), reverse=bDescending)
+
+    return listTasks
+
+# Sync loop: take (or keep) the leader lock, and pull the folder changes while we hold it
+def sync_ticket_mirror():
+    sWorkerID = uuid.uuid4().hex
+
+    while True:
+        try:
+            if hold_leader_lock(MIRROR_LEADER_KEY, sWorkerID, MIRROR_MAX_AGE):
+                serviceAccount = get_service_account()
+                try:
+                    iChanges = ticketMirror.sync(get_tickets_folder(serviceAccount))
+                except ErrorInvalidSyncStateData:
+                    # State token no longer accepted, start over with a full sync
+                    ticketMirror.reset()
+                    iChanges = ticketMirror.sync(get_tickets_folder(serviceAccount))
+                except ErrorFolderNotFound:
+                    # Folder moved, resolve it again and start over
+                    ticketMirror.reset()
+                    iChanges = ticketMirror.sync(get_tickets_folder(serviceAccount, refresh=True))
+                if TESTING_MODE == True:
+                    print("Ticket mirror synced: " + str(iChanges) + " changes")
+        except Exception as e:
+            # Keep the sync loop alive, the routes fall back to EWS while the mirror is stale
+            print("Ticket mirror sync error: " + str(e))
+
+        time.sleep(m_iMirrorSyncInterval)
+
+#################
+# Live Updates
+#################
+
+# With LIVE_UPDATES, one worker (holding the redis leader lock) keeps an EWS streaming subscription
+# on the tickets folder. Changed tickets are fetched, published to the channels of the pages they
+# show up on (see ticket_notifications.py) and their cached lists are dropped. The open pages get
+# the changes from /live/<assignee|client>/<ID> as Server-Sent Events and patch their table.
+# Each open page holds a worker thread, so run gunicorn with threaded (gthread) or gevent workers.
+ticketNotifier = TicketNotifier(r)
+liveHub = LiveHub(r)
+
+LIVE_LEADER_KEY = "webtickets:live:leader"
+
+# Seconds between attempts to take over the subscription (or to subscribe again after an error)
+LIVE_RETRY_INTERVAL = 10
+
+# Leader lock outlives a few streaming connections, a dead leader is replaced after that
+LIVE_LEADER_TTL = m_iLiveConnectionTimeout * 60 * 3
+
+# Task fields fetched for a changed ticket
+LIVE_FIELDS = ("subject", "categories", "dateCreated_property", "client_property", "assignee_property",
+    "hrsActualTotal_property", "datelastactivity_property")
+
+# Channels (pages) a ticket shows up on, following the ticket loaders:
+#   client:<ID> and assignee:<ID> unless it is in '9 REVIEW',
+#   placeholder when it is unassigned and only in 'Place Holder' category
+def ticket_channels(task):
+    if ticket_in_review(task):
+        return []
+    listChannels = ["client:" + (task.client_property or "")]
+    if task.assignee_property:
+        listChannels.append("assignee:" + task.assignee_property)
+    elif task.categories == ["Place Holder"]:
+        listChannels.append("placeholder")
+    return listChannels
+
+# Drops the cached ticket lists behind the passed channels
+def invalidate_channels(setChannels):
+    for sChannel in setChannels:
+        sKind, _, sValue = sChannel.partition(":")
+        if sKind == "placeholder":
+            invalidate_ticket_cache("placeholder")
+        elif sKind == "assignee":
+            invalidate_ticket_cache("assignee", sValue)
+        elif sKind == "client":
+            invalidate_ticket_cache("client", sValue)
+            invalidate_ticket_cache("portal", sValue)
+            invalidate_client_portal(sValue)
+
+# Publishes a batch of folder changes: ("upsert" | "delete", item ID, change key) tuples
+def apply_ticket_changes(account, listChanges):
+    setTouched = set()
+    listUpserts = [(sItemID, sChangeKey) for sChange, sItemID, sChangeKey in listChanges if sChange == "upsert"]
+
+    if listUpserts:
+        with ews_call("live_get_item"):
+            listItems = list(account.fetch(ids=listUpserts, folder=get_tickets_folder(account), only_fields=LIVE_FIELDS))
+        for (sItemID, _), item in zip(listUpserts, listItems):
+            if isinstance(item, Exception):
+                # Gone again before we got to it
+                setTouched |= ticketNotifier.publish_delete(sItemID)
+                continue
+            setTouched |= ticketNotifier.publish_upsert(item.id, ticket_channels(item), Ticket.from_task(item).to_json())
+
+    for sChange, sItemID, _ in listChanges:
+        if sChange == "delete":
+            setTouched |= ticketNotifier.publish_delete(sItemID)
+
+    invalidate_channels(setTouched)
+    LIVE_EVENTS.inc(len(listChanges))
+    if TESTING_MODE == True:
+        print("Live updates: " + str(len(listChanges)) + " changes, channels " + str(sorted(setTouched)))
+
+# Watch loop: take (or keep) the leader lock, and hold the streaming subscription while we have it.
+# fnSource(account) returns the notification source (a StreamingNotificationSource on the tickets
+# folder by default, see FakeNotificationSource for tests).
+def watch_ticket_folder(fnSource=None):
+    if fnSource is None:
+        fnSource = lambda account: StreamingNotificationSource(get_tickets_folder(account), m_iLiveConnectionTimeout)
+    sWorkerID = uuid.uuid4().hex
+
+    while True:
+        try:
+            if hold_leader_lock(LIVE_LEADER_KEY, sWorkerID, LIVE_LEADER_TTL):
+                serviceAccount = get_service_account()
+                for listChanges in fnSource(serviceAccount).batches():
+                    if listChanges:
+                        apply_ticket_changes(serviceAccount, listChanges)
+                    if not hold_leader_lock(LIVE_LEADER_KEY, sWorkerID, LIVE_LEADER_TTL):
+                        break
+        except Exception as e:
+            # Events may have been missed, so the open pages reload
+            print("Live updates error: " + str(e))
+            ticketNotifier.publish_reset()
+
+        time.sleep(LIVE_RETRY_INTERVAL)
+
+# Server-Sent Events stream of the messages published to listChannels (plus the broadcast channel)
+def live_stream(listChannels):
+    q = liveHub.subscribe(listChannels + [BROADCAST_CHANNEL])
+    LIVE_CONNECTIONS.set(liveHub.connections())
+
+    def generate():
+        try:
+            # Browsers reconnect 5 seconds after losing the stream
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    sMessage = q.get(timeout=m_iLiveHeartbeat)
+                except queue.Empty:
+                    # Keeps proxies from closing an idle stream, and notices closed connections
+                    yield ": keepalive\n\n"
+                    continue
+                yield "event: ticket\ndata: " + sMessage + "\n\n"
+        finally:
+            liveHub.unsubscribe(q)
+            LIVE_CONNECTIONS.set(liveHub.connections())
+
+    response = current_app.response_class(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Don't let nginx buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# URL of the page's live stream, or None when live updates are off
+def live_url(sKind, sValue):
+    if not m_bLiveUpdates:
+        return None
+    return url_for("webtickets.live_tickets", kind=sKind, value=sValue)
+
+##########################
+# Background Threads
+##########################
+
+backgroundThreads = None
+backgroundThreadsLock = threading.Lock()
+
+# Starts this process's background threads (once, and after any gunicorn fork)
+@webTickets.before_app_request
+def start_background_threads():
+    global backgroundThreads
+    if backgroundThreads is not None:
+        return
+    with backgroundThreadsLock:
+        if backgroundThreads is None:
+            listThreads = [threading.Thread(target=refresh_placeholder_snapshot, name="placeholder-refresher", daemon=True)]
+            if m_bMirrorEnabled:
+                listThreads.append(threading.Thread(target=sync_ticket_mirror, name="ticket-mirror", daemon=True))
+            if m_bLiveUpdates:
+                listThreads.append(threading.Thread(target=watch_ticket_folder, name="live-updates", daemon=True))
+            if m_bTimeEntryJobs:
+                for i in range(m_iJobWorkers):
+                    listThreads.append(threading.Thread(target=process_time_entry_jobs, name="time-entry-worker-" + str(i), daemon=True))
+            for thread in listThreads:
+                thread.start()
+            backgroundThreads = listThreads
+
+###################
+# Login Prefetch
+###################
+
+# Right after login, the user's dashboard (home) is loaded in the background, so the redirect to /
+# finds the folder, the assignee's tickets, the 'Place Holder' tickets and the recent time entries
+# already cached. The loads go through the same caches (and single flight) as home(), so a request
+# arriving mid-prefetch waits for the prefetch instead of querying EWS again.
+PREFETCH_PREFIX = "webtickets:prefetch:"
+
+# Runs one prefetch step, logging (not raising) its errors: the dashboard just loads them itself
+def prefetch_step(sStep, fn):
+    try:
+        fn()
+    except Exception as e:
+        print("Login prefetch error (" + sStep + "): " + str(e))
+
+# Starts the prefetch for a user who just logged in. Steps are handed to the EWS pool and not
+# waited on (callback() redirects right away).
+def start_login_prefetch(sUserKey, email):
+    # Logging in twice in a row doesn't prefetch twice
+    if not m_bLoginPrefetch or not r.set(PREFETCH_PREFIX + sUserKey, "1", nx=True, ex=m_iEWSCallTimeout):
+        return
+
+    # Same assignee ID as the / route
+    assigneeID = str(email)[:2].lower()
+
+    def prefetch():
+        account = get_user_account(sUserKey, email)
+        if account is None:
+            return
+
+        # Recent time entries don't need the tickets folder, start them right away
+        ewsExecutor.submit(prefetch_step, "calendar", lambda: get_recent_time_entries(account, sUserKey))
+
+        # Resolve the folder once, before the two ticket loads that need it
+        prefetch_step("folder", lambda: get_tickets_folder(account))
+        ewsExecutor.submit(prefetch_step, "assignee", lambda: get_cached_tickets("assignee", assigneeID,
+            lambda: load_tickets(account, assignee_property__exact=assigneeID)))
+        ewsExecutor.submit(prefetch_step, "placeholder", lambda: get_placeholder_tickets(account))
+
+    ewsExecutor.submit(prefetch_step, "account", prefetch)
+
+##################
+#  / Root Path
+##################
+@webTickets.route('/')
+def index():
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if ensure_token():
+        if TESTING_MODE == True:
+            print("Token ref: " + str(session["token_ref"]))
+
         # Gets users email, name and assigneeID
         email = str(session["email"])
         name = str(session["name"])
@@ -155,7 +1796,7 @@ def index():
         # If access token is not in redis cache:
         # 1. Generate auth url
         # 2. Redirect to 365 login.
-        auth_url = webTicketsApp.get_authorization_request_url(scopes=m_sScope, redirect_uri=m_sRedirectURI)
+        auth_url = get_login_app().get_authorization_request_url(scopes=m_sScope, redirect_uri=m_sRedirectURI)
         if TESTING_MODE == True:
             print(auth_url) # debug
         return redirect(auth_url)
@@ -164,19 +1805,30 @@ def index():
 # Callback Route
 # Redirect after authentication
 #################################
-@app.route("/callback")
+@webTickets.route("/callback")
 def callback():
 
     # Get auth code from response
+    # (redeemed into a fresh token cache, which then holds this user's refresh token)
     code = request.args.get("code")
-    result = webTicketsApp.acquire_token_by_authorization_code(
+    cache = SerializableTokenCache()
+    msalApp = build_msal_app(cache)
+    result = msalApp.acquire_token_by_authorization_code(
         code,
         scopes=m_sScope,
         redirect_uri=m_sRedirectURI
     )
 
-    # Store access token in cache
-    session["access_token"] = result
+    # Persist the token cache under the user's home account ID
+    accounts = msalApp.get_accounts()
+    if accounts:
+        session["user_key"] = accounts[0]["home_account_id"]
+    else:
+        session["user_key"] = result["id_token_claims"]["preferred_username"].lower()
+    save_token_cache(session["user_key"], cache)
+
+    # Store access token in cache (server-side, referenced from the session)
+    store_session_token(result)
     if TESTING_MODE == True:
         print(str(result)) # debug
 
@@ -188,15 +1840,18 @@ def callback():
     if TESTING_MODE == True:
         print("Session: " + session["name"])
 
+    # Start loading the dashboard while the browser follows the redirect
+    start_login_prefetch(session["user_key"], session["email"])
+
     # Redirect to root(/) route
     return redirect("/")
 
 #########################
 # Favicon Route
 ########################
-@app.route('/favicon.ico')
+@webTickets.route('/favicon.ico')
 def favicon():
-    return send_from_directory(os.path.join(app.root_path, 'static'), 'favicon.ico',mimetype='image/vnd.microsoft.icon')
+    return send_from_directory(os.path.join(current_app.root_path, 'static'), 'favicon.ico',mimetype='image/vnd.microsoft.icon')
 
 ####################
 # Remove HTML tags
@@ -204,369 +1859,635 @@ def favicon():
 def remove_html_tags(html_text):
     return html2text.html2text(html_text)
 
+###################
+# Calendar Entries
+###################
+
+# Calendar fields the time entry panel shows (body is left out with CALENDAR_LAZY_BODY,
+# and loaded by /calendar-body when the user expands an entry)
+CALENDAR_FIELDS = ("subject", "start", "end", "location") + (() if m_bCalendarLazyBody else ("body",))
+
+CALENDAR_CACHE_PREFIX = "webtickets:calendar:"
+
+# Converts a calendar item's body to what the panel shows
+def clean_calendar_body(sBody):
+    # Check if the item's body contains "<html>" - due to Teams extension on outlook
+    if sBody and "<html>" in sBody:
+        # Remove HTML tags and update the item's body
+        sBody = remove_html_tags(sBody)
+
+        # Delete everything after underscore
+        if sBody.count('_') >= 10:
+            # Remove text from the first underscore on
+            sBody = sBody[:sBody.find('_')]
+    return sBody
+
+##########################
+# Calendar Body Cache
+##########################
+
+# html2text on a large Teams invite is expensive, so cleaned bodies are kept in redis by
+# item ID + change key (a new change key means the body may have changed).
+#   webtickets:calbody       hash: "<item ID>:<change key>" -> cleaned body
+#   webtickets:calbody:lru   sorted set: same fields, scored by last use
+# Once there are more than m_iCalendarBodyCacheSize bodies the least recently used are dropped.
+CALENDAR_BODY_KEY = "webtickets:calbody"
+CALENDAR_BODY_LRU_KEY = "webtickets:calbody:lru"
+
+# Returns the cleaned body, converting and caching it on a miss
+def get_clean_calendar_body(sItemID, sChangeKey, sBody):
+    # Plain text bodies are returned as they are, there is nothing to save
+    if not sBody or "<html>" not in sBody:
+        return sBody
+
+    sField = sItemID + ":" + sChangeKey
+
+    cached = r.hget(CALENDAR_BODY_KEY, sField)
+    count_cache("calendar_body", cached is not None)
+    if cached is not None:
+        # Mark as recently used
+        r.zadd(CALENDAR_BODY_LRU_KEY, {sField: time.time()})
+        return cached.decode()
+
+    sBody = clean_calendar_body(sBody)
+
+    pipe = r.pipeline()
+    pipe.hset(CALENDAR_BODY_KEY, sField, sBody)
+    pipe.zadd(CALENDAR_BODY_LRU_KEY, {sField: time.time()})
+    pipe.zcard(CALENDAR_BODY_LRU_KEY)
+    iCount = pipe.execute()[-1]
+
+    # Evict the least recently used bodies over the limit
+    if iCount > m_iCalendarBodyCacheSize:
+        listOldest = r.zrange(CALENDAR_BODY_LRU_KEY, 0, iCount - m_iCalendarBodyCacheSize - 1)
+        if listOldest:
+            pipe = r.pipeline()
+            pipe.hdel(CALENDAR_BODY_KEY, *listOldest)
+            pipe.zrem(CALENDAR_BODY_LRU_KEY, *listOldest)
+            pipe.execute()
+
+    return sBody
+
+# Loads the user's latest time entries: the items that ended in the last m_iCalendarDays days,
+# ordered by end time (latest first) and capped at m_iCalendarItems, all done by EWS.
+# Returns the panel's events and the formatted end time of the latest entry ("" if there is none).
+def load_recent_time_entries(account):
+    # Window is [now - m_iCalendarDays, now], so meetings booked ahead don't count as time entries
+    window_end = EWSDateTime.now(tz=UTC)
+    window_start = window_end - timedelta(days=m_iCalendarDays)
+
+    # Filtered FindItem rather than a calendar view: EWS can't sort or restrict a CalendarView,
+    # and time entries are single items so recurring occurrences don't need expanding
+    with ews_call("calendar_find_item"):
+        calendar_items = list(account.calendar.filter(end__gte=window_start, end__lte=window_end)\
+            .order_by('-end').only(*CALENDAR_FIELDS)[:m_iCalendarItems])
+
+    # Collect the retrieved calendar events (latest on top)
+    calendar_events = []
+    latest_end_time = ""
+    for item in calendar_items:
+        if not isinstance(item, CalendarItem):
+            continue
+        # Items come back latest first, so the first one is the latest end time
+        if not latest_end_time:
+            latest_end_time = format_eastern(item.end, EVENT_DATE_FORMAT)
+        calendar_events.append({
+            'id': item.id,
+            'changekey': item.changekey,
+            'subject': item.subject,
+            'start': format_eastern(item.start, EVENT_DATE_FORMAT),
+            'end': format_eastern(item.end, EVENT_DATE_FORMAT),
+            'location': item.location,
+            # None with CALENDAR_LAZY_BODY, the page loads it from /calendar-body
+            'body': None if m_bCalendarLazyBody else get_clean_calendar_body(item.id, item.changekey, item.body)
+        })
+
+    return {"events": calendar_events, "latest_end_time": latest_end_time}
+
+# Returns the user's recent time entries, loading them (and caching them for m_iCalendarCacheTTL
+# seconds) on a miss. Dropped by /create-meeting when the user adds an entry.
+def get_recent_time_entries(account, sUserKey):
+    sKey = CALENDAR_CACHE_PREFIX + sUserKey
+
+    cached = r.get(sKey)
+    count_cache("calendar", cached is not None)
+    if cached is not None:
+        return json.loads(cached)
+
+    # Shared with a login prefetch still loading them (see start_login_prefetch)
+    try:
+        return single_flight(sKey, lambda: load_recent_time_entries(account), m_iCalendarCacheTTL, json.dumps, json.loads)
+    except EWS_UNAVAILABLE_ERRORS as e:
+        # The panel is secondary, show the tickets without it rather than failing the page (not cached)
+        if TESTING_MODE == True:
+            print("Recent time entries unavailable: " + str(e))
+        return {"events": [], "latest_end_time": ""}
+
+# Drops the user's cached time entries
+def invalidate_recent_time_entries(sUserKey):
+    r.delete(CALENDAR_CACHE_PREFIX + sUserKey)
+
 ###############################
 # Index Route
 # Redirected here after root
 ###############################
-@app.route('/index/<string:assigneeID>')
+@webTickets.route('/index/<string:assigneeID>')
 def home(assigneeID):
     # Make sure assigneeID is lowercase (all of our assignee ID's on 365 are lowercase)
     assigneeID = assigneeID.lower()
-    # Checks for token in redis cache
-    if "access_token" in session:
-        # Define Exchangelib creds.
-        creds = OAuth2AuthorizationCodeCredentials(access_token=session["access_token"])
-        if TESTING_MODE == True:
-            print("Creds var: " + str(creds))
-
-        # Define Exchangelib config.
-        conf = Configuration(server="outlook.office365.com", auth_type=OAUTH2, credentials=creds, retry_policy=FaultTolerance(max_wait=3600))
-
-        # Define the Exchangelib account, passing creds w/ access token
-        account = Account(
-            primary_smtp_address=session["email"],
-            access_type=DELEGATE,
-            config=conf,
-            autodiscover=False,
-        )
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if ensure_token():
+        # Get the pooled Exchangelib account for this user
+        account = get_session_account()
         
-        # Traverse to our public folders root.
-        fPublic = account.public_folders_root
-
-        # Define folders to search for
-        fTB = 'TECHBLDRS INC'
-        fSubfolder = 'TB Tickets'
-
-        # Traverse to 'TB Tickets' folder
-        fParent = fPublic / fTB
-        cTasks = fParent / fSubfolder
-
-
-        # Sort the tasks by passed assigneeID 
-        cSortedTickets = cTasks.filter(assignee_property__exact=assigneeID).order_by('client_property', '-dateCreated_property')\
-            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property")
-
-        # Sort the tasks by assigneeID as none
-        cSortedTicketsNone = cTasks.filter(assignee_property__exact="").order_by('client_property', '-dateCreated_property')\
-            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property")
-
-
-        # Define list to store tickets with assignee=""
-        # This list contains the complete ticket
-        listTicketsNone = []
-
-        # Add tasks to listTicketsNone
-        for task in reversed(list(cSortedTicketsNone)):
-            # Filter for tickets in 'Place Holder' category
-            if task.categories == ["Place Holder"]:
-                # Parse the properties to the dictionary
-                # This dict contains the tickets (in 'Place Holder' category) without a formatted date
-                ticketsNone_data = {
-                    'Subject': task.subject,
-                    'Category': task.categories,
-                    'Date Created': task.dateCreated_property,
-                    'Hours (Actual)': task.hrsActualTotal_property,
-                    'Last Activity': task.datelastactivity_property
-                }
-                # Add to listTicketsNone dictionary
-                listTicketsNone.append(ticketsNone_data)
-
-        # Define list to store tickets
-        # This list contains the complete ticket
-        listTickets = []
-
-        # Traverse through the cSortedTickets (reversed so that last activity is at the top)
-        for task in reversed(list(cSortedTickets)):
-            if TESTING_MODE == True:
-                print("Ticket Subject: ", task.subject)
-            # Filter out the tickets in 'Review' category
-            if task.categories != ["9 REVIEW"]:
-                    # Parse the properties to the dictionary
-                    # This dict contains the ticket without a formatted date
-                    tickets_data = {
-                        'Subject': task.subject,
-                        'Category': task.categories,
-                        'Date Created': task.dateCreated_property,
-                        'Hours (Actual)': task.hrsActualTotal_property,
-                        'Last Activity': task.datelastactivity_property
-                    }
-                    # Add to listTickets dictionary
-                    listTickets.append(tickets_data)
-        
-        # Convert the "Last Activity", "Date Created" timestamp to Eastern Standard Time (EST)
-        # (Accounts for DST and Standard Time Transitions)
-        eastern_tz = pytz.timezone('US/Eastern')
-        for tickets_data in listTickets:
-            last_created_utc = tickets_data['Date Created']
-            last_created_est = last_created_utc.astimezone(eastern_tz)
-            tickets_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
-
-            last_activity_utc = tickets_data['Last Activity']
-            last_activity_est = last_activity_utc.astimezone(eastern_tz)
-            tickets_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
-
-        for ticketsNone_data in listTicketsNone:
-            last_created_utc = ticketsNone_data['Date Created']
-            last_created_est = last_created_utc.astimezone(eastern_tz)
-            ticketsNone_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
-            
-            last_activity_utc = ticketsNone_data['Last Activity']
-            last_activity_est = last_activity_utc.astimezone(eastern_tz)
-            ticketsNone_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
-        
-        # Merge the dictionaries
-        merged_dict = listTickets + listTicketsNone
+        # Read before fanning out, the session isn't available on the executor threads
+        sUserKey = session["user_key"]
+
+        # Get the tickets assigned to assigneeID followed by the unassigned tickets in 'Place Holder' category,
+        # and the latest time entries, all at the same time
+        merged_dict, dictPaging, (dictEntries,) = get_ticket_rows("assignee", assigneeID, account,
+            lambda: get_recent_time_entries(account, sUserKey), assignee_property__exact=assigneeID)
 
         # Make assigneeID uppercase to display on webpage
         assigneeID = assigneeID.upper()
-        
-        # Create list to store time entries
-        calendar_items = []
-        # Loop through 5 entries, only retrieves select fields
-        for item in account.calendar.all().only("subject", "start", "end", "location", "body"):
-            # Check if the item's body contains "<html>" - due to Teams extension on outlook
-            if "<html>" in item.body:
-                # Remove HTML tags and update the item's body
-                plain_text_body = remove_html_tags(item.body)
-                # Save the item.body to the new updated body
-                item.body = plain_text_body
-
-                # Delete everything after underscore
-                if item.body.count('_') >= 10:
-                    # Find the index of the first underscore
-                    first_underscore_index = item.body.find('_')
-                    # Remove text from the start to including the first underscore
-                    plain_text_body = item.body[:first_underscore_index]
-                    # Save the item.body to the new updated body
-                    item.body = plain_text_body
-
-            # Add items to list
-            calendar_items.append(item)
-            # Stop retrieving items after 5
-            if len(calendar_items) == 5:
-                break
-        
-        # Reverse list to keep latest on top
-        calendar_items.reverse()
 
         # Print cal items
         if TESTING_MODE == True:
-            print("calendar items: ", calendar_items)
-
-        # Find the latest end time
-        latest_end_time = None
-        for item in calendar_items:
-            if isinstance(item, CalendarItem):
-                end_time = item.end.astimezone(timezone("US/Eastern"))
-                if latest_end_time is None or end_time > latest_end_time:
-                    latest_end_time = end_time
-
-        # Format the latest_end_time for display in the template
-        formatted_latest_end_time = latest_end_time.strftime('%m/%d/%Y %I:%M %p')
-
-        # Create an empty list to store the calendar events
-        calendar_events = []
-        # Collect the retrieved calendar events
-        for item in reversed(list(calendar_items)):
-            if isinstance(item, CalendarItem):
-                event_data = {
-                    'subject': item.subject,
-                    'start': item.start.astimezone(timezone("US/Eastern")).strftime('%m/%d/%Y %I:%M %p'),
-                    'end': item.end.astimezone(timezone("US/Eastern")).strftime('%m/%d/%Y %I:%M %p'),
-                    'location': item.location,
-                    'body': item.body
-                }
-                print(event_data)
-                calendar_events.append(event_data)
-        
-        # Set the time zone to 'US/Eastern' which accounts for DST
-        eastern_timezone = pytz.timezone('US/Eastern')
+            print("calendar items: ", dictEntries["events"])
 
         # Get the current UTC time
         utc_now = datetime.utcnow()
 
         # Convert the UTC time to the Eastern time zone (accounting for DST)
-        est_now = utc_now.replace(tzinfo=pytz.utc).astimezone(eastern_timezone)
+        est_now = utc_now.replace(tzinfo=pytz.utc).astimezone(EASTERN_TZ)
 
         # Format the EST/EDT time as a string
         formatted_time = est_now.strftime('%Y-%m-%dT%H:%M')
 
         # Pass the assigneeID and listTickets list to html render
-        return render_template('home.html', assigneeID=assigneeID, tasks=merged_dict, events=calendar_events,\
-                                latest_end_time=formatted_latest_end_time, currentime=formatted_time)
+        return render_tickets('home.html', assigneeID=assigneeID, tasks=merged_dict, events=dictEntries["events"],\
+                                latest_end_time=dictEntries["latest_end_time"], currentime=formatted_time,\
+                                live_url=live_url("assignee", assigneeID.lower()), **dictPaging)
     else:
         # Return error page.
         return render_template("error.html")
 
+################
+# Time Entries
+################
+
+# Every time entry is sent to the help desk mailbox
+TIME_ENTRY_ATTENDEES = ["help@techbldrs.com"]
+
+# Format of the datetime-local inputs on the time entry forms
+TIME_ENTRY_FORMAT = '%Y-%m-%dT%H:%M'
+
+# Checks one submitted entry (a dict with subject, start_time, end_time, body and an optional clientID).
+# Returns (entry, None) with start/end converted to Eastern datetimes, or (None, error message).
+def parse_time_entry(dictEntry):
+    if not isinstance(dictEntry, dict):
+        return None, "entry must be an object"
+
+    subject = str(dictEntry.get('subject') or "").strip()
+    if not subject:
+        return None, "subject is required"
+
+    try:
+        # Convert start_time and end_time strings to datetime objects in the specified time zone
+        start_datetime = EASTERN_TZ.localize(datetime.strptime(str(dictEntry.get('start_time')), TIME_ENTRY_FORMAT))
+        end_datetime = EASTERN_TZ.localize(datetime.strptime(str(dictEntry.get('end_time')), TIME_ENTRY_FORMAT))
+    except ValueError:
+        return None, "start_time and end_time must look like 2024-01-31T13:30"
+
+    if end_datetime <= start_datetime:
+        return None, "end_time must be after start_time"
+
+    return {
+        'subject': subject,
+        'start': start_datetime,
+        'end': end_datetime,
+        'body': dictEntry.get('body') or "",
+        'clientID': str(dictEntry.get('clientID') or "").upper()
+    }, None
+
+# Checks a list of entries together: each entry on its own, then no two entries in the
+# list may overlap. Returns (entries, errors), errors is a list of (index, message).
+def validate_time_entries(listEntries):
+    listParsed = []
+    listErrors = []
+    for i, dictEntry in enumerate(listEntries):
+        entry, sError = parse_time_entry(dictEntry)
+        if sError is not None:
+            listErrors.append((i, sError))
+        listParsed.append(entry)
+
+    # Overlaps are checked in start order, against the latest ending entry so far
+    listValid = sorted((entry['start'], i) for i, entry in enumerate(listParsed) if entry is not None)
+    iLatest = None
+    for start_datetime, i in listValid:
+        if iLatest is not None and start_datetime < listParsed[iLatest]['end']:
+            listErrors.append((i, "overlaps entry " + str(iLatest)))
+        if iLatest is None or listParsed[i]['end'] > listParsed[iLatest]['end']:
+            iLatest = i
+
+    listErrors.sort()
+    return listParsed, listErrors
+
+# Builds the calendar item for a parsed entry (stamped with the ID of the job sending it, if any)
+def build_time_entry(account, entry, sJobID=None):
+    return CalendarItem(
+        account=account,
+        folder=account.calendar,
+        start=entry['start'],
+        end=entry['end'],
+        subject=entry['subject'],
+        location="",
+        body=entry['body'],
+        required_attendees=TIME_ENTRY_ATTENDEES,
+        timeEntryJob_property=sJobID
+    )
+
+# Drops the cached ticket lists and time entries the user's new time entries may have changed
+def invalidate_after_time_entries(listClientIDs, sUserKey=None, email=None):
+    if sUserKey is None:
+        sUserKey, email = session["user_key"], session["email"]
+    invalidate_recent_time_entries(sUserKey)
+    invalidate_ticket_cache("assignee", str(email)[:2].lower())
+    for clientID in set(listClientIDs):
+        if clientID:
+            invalidate_ticket_cache("client", clientID)
+            invalidate_client_portal(clientID)
+
+####################
+# Time Entry Jobs
+####################
+
+# With TIME_ENTRY_JOBS, /create-meeting and /create-meetings only queue the time entries and answer right away;
+# a pool of job workers (JOB_WORKERS threads per process, or flask time-entry-workers) sends it through EWS.
+#   webtickets:jobs:<job ID>            JSON job: user, entry, status, attempts, error
+#   webtickets:jobs:queue               list of job IDs ready to run
+#   webtickets:jobs:processing:<worker> list of the job IDs a worker took from the queue (BLMOVE)
+#   webtickets:jobs:retry               sorted set of job IDs waiting to be retried, scored by when
+#   webtickets:jobs:idem:<user>:<key>   "<entry hash>:<job ID>" already queued for the form's idempotency key
+# A failed send is retried with exponential backoff until JOB_MAX_ATTEMPTS attempts. Jobs left in the
+# processing list of a worker that died or hung are put back on the queue after JOB_RUNNING_TIMEOUT.
+JOB_PREFIX = "webtickets:jobs:"
+JOB_QUEUE_KEY = JOB_PREFIX + "queue"
+JOB_RETRY_KEY = JOB_PREFIX + "retry"
+JOB_PROCESSING_PREFIX = JOB_PREFIX + "processing:"
+JOB_REAPER_KEY = JOB_PREFIX + "reaper"
+
+# Seconds between looks for stuck jobs (by whichever worker takes the reaper lock)
+JOB_REAP_INTERVAL = 30
+
+# Errors EWS raises before the item is created (throttling, or the circuit breaker not letting the
+# call through): the send can be retried as is. Any other error while sending may have come after
+# Exchange created the item and sent the invitation (e.g. a read timeout), so the retry first looks
+# for the item.
+JOB_NOT_SENT_ERRORS = EWS_THROTTLE_ERRORS + (CircuitOpenError,)
+
+# Backoff before retry n: 5s, 10s, 20s, ... capped at 5 minutes
+def job_backoff(iAttempts):
+    return min(300, 5 * 2 ** (iAttempts - 1))
+
+def load_job(sJobID):
+    cached = r.get(JOB_PREFIX + sJobID)
+    return json.loads(cached) if cached is not None else None
+
+def save_job(job):
+    job["updated"] = time.time()
+    r.set(JOB_PREFIX + job["id"], json.dumps(job), ex=m_iJobTTL)
+
+# Queues a parsed time entry for the logged in user. Resubmitting the same idempotency key with the
+# same entry (e.g. a double click or a browser retry) returns the job that was already queued.
+# The key is stored with a hash of the entry, so a different entry sent with a reused key
+# (e.g. a form brought back with the Back button) is queued as a new job.
+def enqueue_time_entry(entry, sIdempotencyKey=None):
+    sJobID = uuid.uuid4().hex
+
+    # Datetimes go in as the form strings and are parsed again by the worker
+    dictEntry = {
+        "subject": entry["subject"],
+        "start_time": entry["start"].strftime(TIME_ENTRY_FORMAT),
+        "end_time": entry["end"].strftime(TIME_ENTRY_FORMAT),
+        "body": entry["body"],
+        "clientID": entry["clientID"]
+    }
+
+    if sIdempotencyKey:
+        sIdemKey = JOB_PREFIX + "idem:" + session["user_key"] + ":" + sIdempotencyKey
+        sHash = hashlib.sha256(json.dumps(dictEntry, sort_keys=True).encode()).hexdigest()
+        if not r.set(sIdemKey, sHash + ":" + sJobID, nx=True, ex=m_iJobTTL):
+            existing = r.get(sIdemKey)
+            if existing is not None:
+                sExistingHash, _, sExistingJobID = existing.decode().partition(":")
+                if sExistingHash == sHash:
+                    return sExistingJobID
+            # Another entry under the same key, this one takes the key over
+            r.set(sIdemKey, sHash + ":" + sJobID, ex=m_iJobTTL)
+
+    job = {
+        "id": sJobID,
+        "user_key": session["user_key"],
+        "email": session["email"],
+        "entry": dictEntry,
+        "status": "queued",
+        "attempts": 0,
+        "error": None,
+        # Set when an attempt may have created the item, the next one looks for it before sending
+        "check_sent": False,
+        "created": time.time()
+    }
+    save_job(job)
+    r.lpush(JOB_QUEUE_KEY, sJobID)
+    return sJobID
+
+# Moves the retries that are due back onto the queue (ZREM makes sure only one worker moves each)
+def requeue_due_jobs():
+    for sJobID in r.zrangebyscore(JOB_RETRY_KEY, 0, time.time()):
+        if r.zrem(JOB_RETRY_KEY, sJobID):
+            r.lpush(JOB_QUEUE_KEY, sJobID)
+
+# Moves the jobs stuck in a processing list back onto the queue: taken by a worker that died before
+# running them, or running for longer than JOB_RUNNING_TIMEOUT (the worker died or hung mid send).
+# Requeued jobs look for their item before sending again. Finished jobs are just cleared.
+def reap_stuck_jobs():
+    if not r.set(JOB_REAPER_KEY, "1", nx=True, ex=JOB_REAP_INTERVAL):
+        return
+
+    now = time.time()
+    for sProcessingKey in r.scan_iter(match=JOB_PROCESSING_PREFIX + "*"):
+        for sJobID in r.lrange(sProcessingKey, 0, -1):
+            job = load_job(sJobID.decode())
+            if job is None or job["status"] in ("done", "failed"):
+                # Expired or finished, the worker died before clearing it
+                r.lrem(sProcessingKey, 1, sJobID)
+                continue
+            if now - job.get("updated", job["created"]) <= m_iJobRunningTimeout:
+                continue
+            # LREM makes sure only one reaper requeues it
+            if r.lrem(sProcessingKey, 1, sJobID):
+                job["status"] = "queued"
+                job["check_sent"] = True
+                save_job(job)
+                r.lpush(JOB_QUEUE_KEY, sJobID)
+                print("Time entry job " + job["id"] + " was stuck, requeued")
+
+# Looks for the item an earlier attempt of the job created
+def find_time_entry(account, sJobID):
+    with ews_call("find_time_entry"):
+        return account.calendar.filter(timeEntryJob_property=sJobID).exists()
+
+# Sends one queued time entry
+def run_time_entry_job(sJobID):
+    job = load_job(sJobID)
+    # Expired, already sent by an earlier delivery of the same ID, or being sent by another worker
+    if job is None or job["status"] in ("done", "running"):
+        return
+
+    job["status"] = "running"
+    job["attempts"] += 1
+    save_job(job)
+
+    bSending = False
+    try:
+        entry, sError = parse_time_entry(job["entry"])
+        if sError is not None:
+            raise ValueError(sError)
+
+        account = get_user_account(job["user_key"], job["email"])
+        if account is None:
+            # Nothing to retry with, the user has to log in again
+            job["attempts"] = m_iJobMaxAttempts
+            raise RuntimeError("login expired, please log in and submit the time entry again")
+
+        # An earlier attempt may have created the item before it failed
+        if job.get("check_sent") and find_time_entry(account, sJobID):
+            print("Time entry job " + sJobID + " was already sent")
+        else:
+            # Send time entry
+            bSending = True
+            with ews_call("create_item"):
+                build_time_entry(account, entry, sJobID).save(send_meeting_invitations=SEND_TO_ALL_AND_SAVE_COPY)
+    except Exception as e:
+        job["error"] = str(e)
+        if bSending and not isinstance(e, JOB_NOT_SENT_ERRORS):
+            job["check_sent"] = True
+        if job["attempts"] < m_iJobMaxAttempts:
+            job["status"] = "retrying"
+            save_job(job)
+            r.zadd(JOB_RETRY_KEY, {sJobID: time.time() + job_backoff(job["attempts"])})
+        else:
+            job["status"] = "failed"
+            save_job(job)
+        print("Time entry job " + sJobID + " error: " + str(e))
+        return
+
+    job["status"] = "done"
+    job["error"] = None
+    save_job(job)
+
+    # Drop the cached ticket lists and time entries the time entry may have changed
+    invalidate_after_time_entries([entry["clientID"]], job["user_key"], job["email"])
+
+# Job worker thread: waits on the queue and runs jobs one at a time. Each job is moved to the
+# worker's processing list while it runs, so it isn't lost if the worker dies (see reap_stuck_jobs).
+def process_time_entry_jobs():
+    sProcessingKey = JOB_PROCESSING_PREFIX + uuid.uuid4().hex
+    while True:
+        try:
+            requeue_due_jobs()
+            reap_stuck_jobs()
+            sJobID = r.blmove(JOB_QUEUE_KEY, sProcessingKey, 5, "RIGHT", "LEFT")
+            if sJobID is not None:
+                try:
+                    run_time_entry_job(sJobID.decode())
+                finally:
+                    r.lrem(sProcessingKey, 1, sJobID)
+        except Exception as e:
+            # Keep the worker alive (e.g. redis restarting)
+            print("Time entry worker error: " + str(e))
+            time.sleep(1)
+
+# Admin command: flask --app app time-entry-workers [--workers N]
+# Runs job workers in their own process, e.g. next to web workers started with JOB_WORKERS=0
+@webTickets.cli.command("time-entry-workers")
+@click.option("--workers", type=int, default=4)
+def time_entry_workers_command(workers):
+    listThreads = [threading.Thread(target=process_time_entry_jobs, name="time-entry-worker-" + str(i), daemon=True)
+        for i in range(workers)]
+    for thread in listThreads:
+        thread.start()
+    click.echo("Sending time entries with " + str(workers) + " workers.")
+    for thread in listThreads:
+        thread.join()
+
 ###########################
 # Create Time Entry Route
 ###########################
-@app.route('/create-meeting', methods=['POST'])
+@webTickets.route('/create-meeting', methods=['POST'])
 def create_meeting_request():
     if request.method == 'POST':
-        # Checks for token in redis cache
-        if "access_token" in session:
+        # Checks for token in redis cache (refreshing it when it is about to expire)
+        if ensure_token():
             # Retrieve user input from html
-            subject = request.form.get('subject')
-            start_time = request.form.get('start_time')
-            end_time = request.form.get('end_time')
-            location = ""
-            attendees = ["help@techbldrs.com"]
-            body = request.form.get('body')
-
-            # Define Exchangelib creds.
-            creds = OAuth2AuthorizationCodeCredentials(access_token=session["access_token"])
-            if TESTING_MODE == True:
-                print("Creds var: " + str(creds))
-
-            # Define Exchangelib config.
-            conf = Configuration(server="outlook.office365.com", auth_type=OAUTH2, credentials=creds)
+            entry, sError = parse_time_entry(request.form.to_dict())
+            if sError is not None:
+                return render_template("timeentryinvalid.html", error=sError), 400
 
-            # Define the Exchangelib account, passing creds w/ access token
-            account = Account(
-                primary_smtp_address=session["email"],
-                access_type=DELEGATE,
-                config=conf,
-                autodiscover=False,
-            )
+            # Queue it and answer right away, the job workers send it
+            if m_bTimeEntryJobs:
+                sJobID = enqueue_time_entry(entry, request.form.get('idempotency_key'))
+                return render_template("timeentryqueued.html", job_id=sJobID), 202
 
-            # Define the time zone
-            time_zone = timezone('US/Eastern')
-
-            # Convert start_time and end_time strings to datetime objects in the specified time zone
-            start_datetime = time_zone.localize(datetime.strptime(start_time, '%Y-%m-%dT%H:%M'))
-            end_datetime = time_zone.localize(datetime.strptime(end_time, '%Y-%m-%dT%H:%M'))
+            # Get the pooled Exchangelib account for this user
+            account = get_session_account()
 
             # Define calendar item
-            item = CalendarItem(
-                account=account,
-                folder=account.calendar,
-                start=start_datetime,
-                end=end_datetime,
-                subject=subject,
-                location=location,
-                body=body,
-                required_attendees=attendees
-            )
+            item = build_time_entry(account, entry)
             
             # Send time entry
-            item.save(send_meeting_invitations=SEND_TO_ALL_AND_SAVE_COPY)
+            with ews_call("create_item"):
+                item.save(send_meeting_invitations=SEND_TO_ALL_AND_SAVE_COPY)
+
+            # Drop the cached ticket lists and time entries the time entry may have changed
+            invalidate_after_time_entries([entry['clientID']])
 
             # Return success message
             return render_template("timeentrysent.html")
         else:
             # Return error page.
-            render_template("error.html")
+            return render_template("error.html")
+
+#################################
+# Time Entry Status Route
+# Polled by the time entry queued page
+#################################
+@webTickets.route('/time-entry-status/<string:jobID>')
+def time_entry_status(jobID):
+    if "user_key" not in session:
+        return jsonify(error="unauthorized"), 401
+
+    # Users only see their own jobs
+    job = load_job(jobID)
+    if job is None or job["user_key"] != session["user_key"]:
+        return jsonify(error="not found"), 404
+
+    return jsonify(status=job["status"], attempts=job["attempts"], error=job["error"])
+
+#################################
+# Bulk Time Entry Route
+# Takes {"entries": [{subject, start_time, end_time, body, clientID}, ...], "idempotency_key": ...}
+#################################
+@webTickets.route('/create-meetings', methods=['POST'])
+def create_meetings_request():
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if not ensure_token():
+        return jsonify(error="unauthorized"), 401
+
+    dictRequest = request.get_json(silent=True) or {}
+    listEntries = dictRequest.get('entries')
+    if not isinstance(listEntries, list) or not listEntries:
+        return jsonify(error="entries must be a non-empty list"), 400
+    if len(listEntries) > m_iMaxTimeEntries:
+        return jsonify(error="at most " + str(m_iMaxTimeEntries) + " entries per request"), 400
+
+    # Nothing is sent unless every entry is valid, so a day isn't half entered
+    listParsed, listErrors = validate_time_entries(listEntries)
+    if listErrors:
+        return jsonify(results=[{"index": i, "ok": False, "error": sError} for i, sError in listErrors]), 400
+
+    # Queue one job per entry and answer right away, the job workers send them and the page polls
+    # /time-entry-status for each job_id. Each entry's idempotency key is the request's key + its index,
+    # so sending the same entries again (e.g. a retry after a lost response) gets the same jobs back.
+    if m_bTimeEntryJobs:
+        sIdempotencyKey = str(dictRequest.get('idempotency_key') or "")
+        listResults = []
+        for i, entry in enumerate(listParsed):
+            sJobID = enqueue_time_entry(entry, sIdempotencyKey + ":" + str(i) if sIdempotencyKey else None)
+            listResults.append({"index": i, "ok": True, "job_id": sJobID})
+        return jsonify(results=listResults), 202
+
+    # Get the pooled Exchangelib account for this user
+    account = get_session_account()
+
+    # One CreateItem call per m_iTimeEntryBatchSize entries, failures come back per item
+    listItems = [build_time_entry(account, entry) for entry in listParsed]
+    with ews_call("bulk_create_item"):
+        listCreated = account.bulk_create(folder=account.calendar, items=listItems,\
+                                          send_meeting_invitations=SEND_TO_ALL_AND_SAVE_COPY, chunk_size=m_iTimeEntryBatchSize)
+
+    listResults = []
+    for i, created in enumerate(listCreated):
+        if isinstance(created, Exception):
+            listResults.append({"index": i, "ok": False, "error": str(created)})
+        else:
+            listResults.append({"index": i, "ok": True, "id": created.id})
+
+    # Drop the cached ticket lists and time entries the time entries may have changed
+    if any(result["ok"] for result in listResults):
+        invalidate_after_time_entries([entry['clientID'] for entry in listParsed])
+
+    # 207 when only some of the entries went through
+    iCreated = sum(1 for result in listResults if result["ok"])
+    iStatus = 200 if iCreated == len(listResults) else (207 if iCreated else 502)
+    return jsonify(results=listResults), iStatus
+
+############################
+# Calendar Body Route
+# Lazily loads a time entry's body when it is expanded
+############################
+@webTickets.route('/calendar-body')
+def calendar_body():
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if not ensure_token():
+        return jsonify(error="unauthorized"), 401
+
+    sItemID = request.args.get('id', '')
+    sChangeKey = request.args.get('changekey', '')
+    if not sItemID or not sChangeKey:
+        return jsonify(error="id and changekey are required"), 400
+
+    # Cleaned bodies are cached by item ID + change key and shared between users, so a cached body is
+    # only served for an entry in the user's own cached time entries. Anything else is fetched from
+    # the user's mailbox, which is what checks they can see the item.
+    pipe = r.pipeline()
+    pipe.get(CALENDAR_CACHE_PREFIX + session["user_key"])
+    pipe.hget(CALENDAR_BODY_KEY, sItemID + ":" + sChangeKey)
+    entries, cached = pipe.execute()
+    if entries is not None and cached is not None and any(event['id'] == sItemID and event['changekey'] == sChangeKey\
+        for event in json.loads(entries)["events"]):
+        r.zadd(CALENDAR_BODY_LRU_KEY, {sItemID + ":" + sChangeKey: time.time()})
+        return jsonify(body=cached.decode())
+
+    # Fetch only the body of the one item from the user's own mailbox
+    account = get_session_account()
+    with ews_call("get_item"):
+        item = next(iter(account.fetch(ids=[(sItemID, sChangeKey)], only_fields=["body"])), None)
+    if not isinstance(item, CalendarItem):
+        return jsonify(error="not found"), 404
+
+    return jsonify(body=get_clean_calendar_body(item.id, item.changekey, item.body))
 
 
 ###############################
 # Fetch Tasks /clientID Route
 # Logic should match fetch-tasks-by-assignee/assigneeID route
 ###############################
-@app.route('/fetch-tasks/<string:clientID>')
+@webTickets.route('/fetch-tasks/<string:clientID>')
 def fetch_tasks(clientID):
     # Make sure clientID is uppercase (all of our client ID's on 365 are uppercase)
     clientID = clientID.upper()
-    # Checks for token in redis cache
-    if "access_token" in session:
-        # Define Exchangelib creds.
-        creds = OAuth2AuthorizationCodeCredentials(access_token=session["access_token"])
-        if TESTING_MODE == True:
-            print("Creds var: " + str(creds))
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if ensure_token():
+        # Get the pooled Exchangelib account for this user
+        account = get_session_account()
 
-        # Define Exchangelib config.
-        conf = Configuration(server="outlook.office365.com", auth_type=OAUTH2, credentials=creds)
-        
-        # Define the Exchangelib account, passing creds w/ access token
-        account = Account(
-            primary_smtp_address=session["email"],
-            access_type=DELEGATE,
-            config=conf,
-            autodiscover=False,
-        )
-
-        # Traverse to our public folders root. "All Public Folders"
-        fPublic = account.public_folders_root
-        
-        # Define folders to search for
-        fTB = 'TECHBLDRS INC'
-        fSubfolder = 'TB Tickets'
-
-        # Traverse to 'TB Tickets' folder
-        fParent = fPublic / fTB
-        cTasks = fParent / fSubfolder # This should be a folder
-
-        # Sort the tasks by passed clinetID 
-        cSortedTickets = cTasks.filter(client_property__exact=clientID).order_by('client_property', '-dateCreated_property')\
-            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property")
-        
-        # Sort the tasks by clinetID none for place holder tickets
-        cSortedTicketsNone = cTasks.filter(assignee_property__exact="").order_by('client_property', '-dateCreated_property')\
-            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property")
-
-        # Define list to store tickets with assignee=""
-        listTicketsNone = []
-        
-        # Add tasks to listTicketsNone
-        for task in reversed(list(cSortedTicketsNone)):
-            if task.categories == ["Place Holder"]:
-                ticketsNone_data = {
-                    'Subject': task.subject,
-                    'Category': task.categories,
-                    'Date Created': task.dateCreated_property,
-                    'Hours (Actual)': task.hrsActualTotal_property,
-                    'Last Activity': task.datelastactivity_property
-                }
-                listTicketsNone.append(ticketsNone_data)
-        
-        # Define list to store tickets
-        # This list contains the complete ticket with formatted dates
-        listTickets = []
-
-        # Traverse through the cSortedTickets (reversed so that last activity is at the top)
-        for task in reversed(list(cSortedTickets)):
-            if TESTING_MODE == True:
-                print(type(task.subject))
-            # Filter out the tickets in 'Review' category
-            if task.categories != ["9 REVIEW"]:
-                # Parse the properties to the dictionary
-                # This dict contains the ticket without a formatted date
-                tickets_data = {
-                    'Subject': task.subject,
-                    'Category': task.categories,
-                    'Date Created': task.dateCreated_property,
-                    'Hours (Actual)': task.hrsActualTotal_property,
-                    'Last Activity': task.datelastactivity_property
-                }
-                # Add to listTickets dictionary
-                listTickets.append(tickets_data)
-        
-        # Convert the "Last Activity" timestamp to Eastern Standard Time (EST)
-        # Convert to 12-hour time
-        eastern_tz = pytz.timezone('US/Eastern')
-        for tickets_data in listTickets:
-            last_created_utc = tickets_data['Date Created']
-            last_created_est = last_created_utc.astimezone(eastern_tz)
-            tickets_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
-
-            last_activity_utc = tickets_data['Last Activity']
-            last_activity_est = last_activity_utc.astimezone(eastern_tz)
-            tickets_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
-
-        for ticketsNone_data in listTicketsNone:
-            last_created_utc = ticketsNone_data['Date Created']
-            last_created_est = last_created_utc.astimezone(eastern_tz)
-            ticketsNone_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
-            
-            last_activity_utc = ticketsNone_data['Last Activity']
-            last_activity_est = last_activity_utc.astimezone(eastern_tz)
-            ticketsNone_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
-        
-        # Merge dictionaries
-        merged_dict = listTickets + listTicketsNone
+        # Get the tickets for clientID followed by the unassigned tickets in 'Place Holder' category
+        merged_dict, dictPaging, _ = get_ticket_rows("client", clientID, account, client_property__exact=clientID)
 
         # Pass the clientID and listTickets list to html render
-        return render_template('task_list.html', clientID=clientID, tasks=merged_dict)
+        return render_tickets('task_list.html', clientID=clientID, tasks=merged_dict, live_url=live_url("client", clientID), **dictPaging)
     else:
         # Return error page.
         return render_template("error.html")
@@ -576,113 +2497,17 @@ def fetch_tasks(clientID):
 # Fetch Tasks /assigneeID Route
 # Logic should match fetch-tasks/clientID route
 ###############################
-@app.route('/fetch-tasks-by-assignee/<string:assigneeID>')
+@webTickets.route('/fetch-tasks-by-assignee/<string:assigneeID>')
 def fetch_tasks_assignee(assigneeID):
     # Make sure assigneeID is lowercase (all of our assignee ID's on 365 are lowercase)
     assigneeID = assigneeID.lower()
-    # Checks for token in redis cache
-    if "access_token" in session:
-        # Define Exchangelib creds.
-        creds = OAuth2AuthorizationCodeCredentials(access_token=session["access_token"])
-        if TESTING_MODE == True:
-            print("Creds var: " + str(creds))
-
-        # Define Exchangelib config.
-        conf = Configuration(server="outlook.office365.com", auth_type=OAUTH2, credentials=creds)
-
-        # Define the Exchangelib account, passing creds w/ access token
-        account = Account(
-            primary_smtp_address=session["email"],
-            access_type=DELEGATE,
-            config=conf,
-            autodiscover=False,
-        )
-        
-        # Traverse to our public folders root.
-        fPublic = account.public_folders_root
-
-        # Define folders to search for
-        fTB = 'TECHBLDRS INC'
-        fSubfolder = 'TB Tickets'
-
-        # Traverse to 'TB Tickets' folder
-        fParent = fPublic / fTB
-        cTasks = fParent / fSubfolder
-
-
-        # Sort the tasks by passed assigneeID 
-        cSortedTickets = cTasks.filter(assignee_property__exact=assigneeID).order_by('client_property', '-dateCreated_property')\
-            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property")
-
-        # Sort the tasks by assigneeID as none
-        cSortedTicketsNone = cTasks.filter(assignee_property__exact="").order_by('client_property', '-dateCreated_property')\
-            .only("subject", "categories", "dateCreated_property", "hrsActualTotal_property", "datelastactivity_property")
-
-
-        # Define list to store tickets with assignee=""
-        # This list contains the complete ticket
-        listTicketsNone = []
-
-        for task in reversed(list(cSortedTicketsNone)):
-            # Filter for tickets in 'Place Holder' category
-            if task.categories == ["Place Holder"]:
-                # Parse the properties to the dictionary
-                # This dict contains the tickets (in 'Place Holder' category) without a formatted date
-                ticketsNone_data = {
-                    'Subject': task.subject,
-                    'Category': task.categories,
-                    'Date Created': task.dateCreated_property,
-                    'Hours (Actual)': task.hrsActualTotal_property,
-                    'Last Activity': task.datelastactivity_property
-                }
-                # Add to listTicketsNone dictionary
-                listTicketsNone.append(ticketsNone_data)
-
-
-        # Define list to store tickets
-        # This list contains the complete ticket
-        listTickets = []
-
-        # Traverse through the cSortedTickets (reversed so that last activity is at the top)
-        for task in reversed(list(cSortedTickets)):
-            if TESTING_MODE == True:
-                print(type(task.subject))
-            # Filter out the tickets in 'Review' category
-            if task.categories != ["9 REVIEW"]:
-                    # Parse the properties to the dictionary
-                    # This dict contains the ticket without a formatted date
-                    tickets_data = {
-                        'Subject': task.subject,
-                        'Category': task.categories,
-                        'Date Created': task.dateCreated_property,
-                        'Hours (Actual)': task.hrsActualTotal_property,
-                        'Last Activity': task.datelastactivity_property
-                    }
-                    # Add to listTickets dictionary
-                    listTickets.append(tickets_data)
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if ensure_token():
+        # Get the pooled Exchangelib account for this user
+        account = get_session_account()
         
-        # Convert the "Last Activity" timestamp to Eastern Standard Time (EST)
-        # Convert to 12-hour time
-        eastern_tz = pytz.timezone('US/Eastern')
-        for tickets_data in listTickets:
-            last_created_utc = tickets_data['Date Created']
-            last_created_est = last_created_utc.astimezone(eastern_tz)
-            tickets_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
-
-            last_activity_utc = tickets_data['Last Activity']
-            last_activity_est = last_activity_utc.astimezone(eastern_tz)
-            tickets_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
-
-        for ticketsNone_data in listTicketsNone:
-            last_created_utc = ticketsNone_data['Date Created']
-            last_created_est = last_created_utc.astimezone(eastern_tz)
-            ticketsNone_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
-            
-            last_activity_utc = ticketsNone_data['Last Activity']
-            last_activity_est = last_activity_utc.astimezone(eastern_tz)
-            ticketsNone_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
-
-        merged_dict = listTickets + listTicketsNone
+        # Get the tickets assigned to assigneeID followed by the unassigned tickets in 'Place Holder' category
+        merged_dict, dictPaging, _ = get_ticket_rows("assignee", assigneeID, account, assignee_property__exact=assigneeID)
         
         # Get current datetime to pass to html
         # Get the current UTC time
@@ -699,7 +2524,8 @@ def fetch_tasks_assignee(assigneeID):
 
 
         # Pass the assigneeID and listTickets list to html render
-        return render_template('task_list_employee.html', assigneeID=assigneeID, tasks=merged_dict, currentime=formatted_est_time)
+        return render_tickets('task_list_employee.html', assigneeID=assigneeID, tasks=merged_dict, currentime=formatted_est_time,\
+            live_url=live_url("assignee", assigneeID), **dictPaging)
     else:
         # Return error page.
         return render_template("error.html")
@@ -714,83 +2540,177 @@ def fetch_tasks_assignee(assigneeID):
 ###############################
 # fetch-tasks-client/clientID Route
 ###############################
-@app.route('/fetch-tasks-client/<string:clientID>')
+@webTickets.route('/fetch-tasks-client/<string:clientID>')
 def fetch_tasks_client(clientID):
     # Make sure clientID is uppercase (all of our client ID's on 365 are uppercase)
     clientID = clientID.upper()
-    # Define Exchangelib creds. 
-    credentials = OAuth2LegacyCredentials(
-        client_id=m_sClientID,
-        client_secret=m_sClientSecret,
-        tenant_id=m_sTenant,
-        username=m_sEmail,
-        password=m_sPassword
-    )
-    config = Configuration(server='outlook.office365.com', credentials=credentials)
-    account = Account(m_sEmail, config=config, access_type=DELEGATE)
-    
-    # Traverse to our public folders root. "All Public Folders"
-    fPublic = account.public_folders_root
-    
-    # Define folders to search for
-    fTB = 'TECHBLDRS INC'
-    fSubfolder = 'TB Tickets'
 
-    # Traverse to 'TB Tickets' folder
-    fParent = fPublic / fTB
-    cTasks = fParent / fSubfolder # This should be a folder
+    # Unauthenticated, so keep refresh loops and crawlers in check
+    limited = limit_client_portal(clientID)
+    if limited is not None:
+        return limited
 
-    # Sort the tasks by passed clientID
-    # Only requests tasks in "Support" or "Billable" reason
-    cSortedTickets = cTasks.filter(
-    Q(client_property__exact=clientID) &
-    (Q(reason_property__exact="Support") | Q(reason_property__exact="Billable"))).order_by('-dateCreated_property').only("subject", "categories", "dateCreated_property",\
-        "hrsActualTotal_property", "datelastactivity_property")
-
-    # Define list to store tickets
-    # This list contains the complete ticket with formatted dates.
-    listTickets = []
+    # Get the rendered page (cached per client, see Client Portal Cache).
+    # ?stream=1 isn't honored here, so it can't be used to get around the cache.
+    dictPage = get_client_portal_page(clientID)
+    return respond_with_etag(dictPage["etag"], lambda: dictPage["html"], bPrivate=False)
 
-    # Traverse through the cSortedTickets (reversed so that last activity is at the top)
-    for task in reversed(list(cSortedTickets)):
-        if (TESTING_MODE == True):
-            print(type(task.subject))
-        # Filter out the tickets in '9 Review', "8 Time", categories and tickets with "-2DEL-" in subject
-        if task.categories != ["9 REVIEW"] and task.categories != ["8 Time"] and "-2DEL-" not in task.subject:
-            # Filter out tickets with "#" after clientID + ticket number
-            if task.subject[12] != '#':
-                # Parse the properties to the dictionary
-                # This dict contains the ticket without a formatted date
-                tickets_data = {
-                    'Subject': task.subject,
-                    'Category': task.categories,
-                    'Date Created': task.dateCreated_property,
-                    'Hours (Actual)': task.hrsActualTotal_property,
-                    'Last Activity': task.datelastactivity_property
-                }
-                # Add to listTickets dictionary
-                listTickets.append(tickets_data)
-    
-    # Convert the "Last Activity" timestamp to Eastern Standard Time (EST)
-    # Convert to 12-hour time
-    eastern_tz = pytz.timezone('US/Eastern')
-    for tickets_data in listTickets:
-        last_created_utc = tickets_data['Date Created']
-        last_created_est = last_created_utc.astimezone(eastern_tz)
-        tickets_data['Date Created'] = last_created_est.strftime('%Y-%m-%d %I:%M %p')
 
-        last_activity_utc = tickets_data['Last Activity']
-        last_activity_est = last_activity_utc.astimezone(eastern_tz)
-        tickets_data['Last Activity'] = last_activity_est.strftime('%Y-%m-%d %I:%M %p')
+#########################################
+# JSON API:
+# Same ticket rows as the HTML routes, with ETag / If-None-Match support for pollers
+#########################################
+
+###############################
+# api/fetch-tasks/clientID Route
+###############################
+@webTickets.route('/api/fetch-tasks/<string:clientID>')
+def api_fetch_tasks(clientID):
+    # Make sure clientID is uppercase (all of our client ID's on 365 are uppercase)
+    clientID = clientID.upper()
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if ensure_token():
+        # Get the pooled Exchangelib account for this user
+        account = get_session_account()
 
+        # Get the tickets for clientID followed by the unassigned tickets in 'Place Holder' category
+        listTickets, dictPaging, _ = get_ticket_rows("client", clientID, account, client_property__exact=clientID)
 
+        return json_tickets(list(listTickets), clientID=clientID, **dictPaging)
+    else:
+        return jsonify(error="Not logged in"), 401
+
+###############################
+# api/fetch-tasks-by-assignee/assigneeID Route
+###############################
+@webTickets.route('/api/fetch-tasks-by-assignee/<string:assigneeID>')
+def api_fetch_tasks_assignee(assigneeID):
+    # Make sure assigneeID is lowercase (all of our assignee ID's on 365 are lowercase)
+    assigneeID = assigneeID.lower()
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if ensure_token():
+        # Get the pooled Exchangelib account for this user
+        account = get_session_account()
+
+        # Get the tickets assigned to assigneeID followed by the unassigned tickets in 'Place Holder' category
+        listTickets, dictPaging, _ = get_ticket_rows("assignee", assigneeID, account, assignee_property__exact=assigneeID)
+
+        return json_tickets(list(listTickets), assigneeID=assigneeID, **dictPaging)
+    else:
+        return jsonify(error="Not logged in"), 401
+
+###############################
+# api/fetch-tasks-client/clientID Route
+###############################
+@webTickets.route('/api/fetch-tasks-client/<string:clientID>')
+def api_fetch_tasks_client(clientID):
+    # Make sure clientID is uppercase (all of our client ID's on 365 are uppercase)
+    clientID = clientID.upper()
 
-    # Pass the clientID and listTickets list to html render
-    return render_template('task_list_client.html', clientID=clientID, tasks=listTickets)
+    # Same limits as the client portal page
+    limited = limit_client_portal(clientID)
+    if limited is not None:
+        return limited
 
+    # Get the shared Exchangelib account for the service account
+    account = get_service_account()
+
+    # Get the tickets shown to the client
+    listTickets = get_client_portal_tickets(account, clientID)
+
+    return json_tickets(listTickets, bPrivate=False, clientID=clientID, stale=isinstance(listTickets, StaleTickets))
+
+
+###############################
+# live/kind/ID Route
+# Server-Sent Events with the changes to the tickets on a staff ticket list
+###############################
+@webTickets.route('/live/<any(assignee, client):kind>/<string:value>')
+def live_tickets(kind, value):
+    # Normalize the ID the same way the ticket list routes do
+    value = value.lower() if kind == "assignee" else value.upper()
+    # Checks for token in redis cache (refreshing it when it is about to expire)
+    if not ensure_token():
+        return jsonify(error="Not logged in"), 401
+    if not m_bLiveUpdates:
+        abort(404)
+
+    # The staff lists end with the 'Place Holder' tickets
+    return live_stream([kind + ":" + value, "placeholder"])
+
+
+##################
+# Metrics Route
+# Prometheus scrape endpoint
+##################
+@webTickets.route('/metrics')
+def metrics():
+    # Optional bearer token, so the endpoint can be exposed on the public listener
+    if m_sMetricsToken and request.headers.get("Authorization") != "Bearer " + m_sMetricsToken:
+        abort(401)
+
+    # Under gunicorn every worker writes its metrics to PROMETHEUS_MULTIPROC_DIR, merge them
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        sOutput = generate_latest(registry)
+    else:
+        sOutput = generate_latest()
+
+    response = make_response(sOutput)
+    response.headers["Content-Type"] = CONTENT_TYPE_LATEST
+    return response
 
 #######################
 # Flask Configuration 
 #######################
+
+# Builds the Flask app. Nothing here goes over the network (redis connects on first use, the MSAL
+# apps are built when a login needs them), so workers boot without redis or Azure AD being reachable.
+# config overrides the settings below, e.g. create_app({"SECRET_KEY": "..."}).
+#   gunicorn "app:create_app()"
+#   flask --app app run
+def create_app(config=None):
+    # Create a Flask web application instance.
+    app = Flask(__name__)
+
+    # Session secret key, from SECRET_KEY so every worker can read the others' sessions
+    app.config['SECRET_KEY'] = m_sSecretKey
+
+    # Sets the max session length to 30 minutes
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
+
+    # Sets the session type to a redis type
+    app.config['SESSION_TYPE'] = 'redis'
+
+    # Points to redis server session.
+    app.config['SESSION_REDIS'] = r
+
+    # Number of reverse proxies in front of the app (None: not known)
+    app.config['PROXY_FIX_X_FOR'] = m_iProxyFixXFor
+
+    if config is not None:
+        app.config.update(config)
+
+    # Take the client's address from X-Forwarded-For, trusting only the configured number of proxies
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    if not app.config['SECRET_KEY']:
+        # Only good for a single development process: sessions don't survive a restart or move between workers
+        print("SECRET_KEY is not set, using a random session key")
+        app.config['SECRET_KEY'] = secrets.token_hex(16)
+
+    # Initialize Session
+    Session(app)
+    app.session_interface.serializer = CompactSessionSerializer()
+
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template_time, app)
+
+    register_extended_properties()
+    app.register_blueprint(webTickets)
+    return app
+
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,251 @@
+# Benchmarks the ticket routes against the fake EWS server in fake_ews.py.
+# For each folder size, every route is timed cold (ticket/calendar caches dropped before each
+# request) and warm (caches left in place), and the latency percentiles, requests per second and
+# EWS calls per request are reported. Nothing here talks to Exchange Online or Azure AD.
+#
+#   python bench.py                          # 100 / 1k / 10k tasks, results in bench_output.txt
+#   python bench.py --sizes 1000 --requests 50 --concurrency 4 --latency 0.05
+#   python bench.py --fake-redis             # no local redis needed (pip install fakeredis)
+#   python bench.py --startup                # only check worker startup: import + create_app() with
+#                                            # the network blocked, fails over --max-startup seconds
+#
+# Uses REDIS_HOST / REDIS_PORT like the app (a scratch database, the benchmark flushes it).
+
+###########
+# IMPORTS
+###########
+
+# INTERNAL:
+import os # For pointing the app at the fake server
+import sys # For the report
+import time # For timing requests
+import json # For seeding tokens
+import argparse # For the command line
+import threading # For the concurrent clients
+from concurrent.futures import ThreadPoolExecutor # For the concurrent clients
+
+import fake_ews # Fake EWS SOAP server
+from startup_check import measure_startup # Worker startup with the network blocked
+
+###############
+# GLOBALS
+###############
+
+# Logged in user the requests run as (assignee "aa" in the synthetic data)
+BENCH_EMAIL = "aa@techbldrs.com"
+BENCH_USER_KEY = "bench-user"
+BENCH_ASSIGNEE = "aa"
+BENCH_CLIENT = "C0001"
+
+# (name, method, path) of the timed routes
+ROUTES = [
+    ("home", "GET", "/index/" + BENCH_ASSIGNEE),
+    ("fetch_tasks", "GET", "/fetch-tasks/" + BENCH_CLIENT),
+    ("fetch_tasks_assignee", "GET", "/fetch-tasks-by-assignee/" + BENCH_ASSIGNEE),
+    ("fetch_tasks_client", "GET", "/fetch-tasks-client/" + BENCH_CLIENT),
+    ("create_meeting_request", "POST", "/create-meeting"),
+]
+
+##################
+# App Setup
+##################
+
+# Imports app.py pointed at the fake server. Returns the app module and the Flask app.
+# The benchmark seeds tokens directly, so login (and with it Azure AD) is never touched.
+def load_app(sEndpoint, bFakeRedis):
+    os.environ["EWS_SERVICE_ENDPOINT"] = sEndpoint
+    # The fake server is plain http
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+    # Mailbox of the service account (client portal)
+    os.environ.setdefault("EMAIL", "service@techbldrs.com")
+    # Send time entries in the request, so create_meeting_request times the whole send (not just
+    # queueing it) and no job workers send in the background while the other routes are timed
+    os.environ["TIME_ENTRY_JOBS"] = "false"
+    # Every request comes from the same address, keep the client portal's rate limits out of the way
+    os.environ["PORTAL_RATE_PER_CLIENT"] = "1000000"
+    os.environ["PORTAL_RATE_PER_IP"] = "1000000"
+
+    if bFakeRedis:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("--fake-redis needs the fakeredis package (pip install fakeredis)")
+        import redis
+        server = fakeredis.FakeServer()
+
+        class BenchRedis(fakeredis.FakeRedis):
+            def __init__(self, *args, **kwargs):
+                super().__init__(server=server)
+
+        redis.Redis = BenchRedis
+
+    import app as webapp
+    return webapp, webapp.create_app({"SECRET_KEY": "bench"})
+
+# Seeds the user's and the service account's tokens (the fake server accepts any token)
+def seed_tokens(webapp):
+    token = {"access_token": "bench-token", "token_type": "Bearer", "expires_at": time.time() + 3600}
+    webapp.r.set(webapp.TOKEN_RECORD_PREFIX + BENCH_USER_KEY, json.dumps(token), ex=3600)
+    webapp.r.set(webapp.ServiceAccountSession.TOKEN_KEY, json.dumps(token), ex=3600)
+    return token
+
+# Returns a test client logged in as the benchmark user
+def make_client(webapp, flaskApp, token):
+    client = flaskApp.test_client()
+    with client.session_transaction() as session:
+        session["email"] = BENCH_EMAIL
+        session["user_key"] = BENCH_USER_KEY
+        session["token_ref"] = webapp.AccountPool.fingerprint(token)
+        session["token_exp"] = int(token["expires_at"])
+    return client
+
+# Drops everything the routes cache, so the next request goes to EWS
+def drop_caches(webapp):
+    webapp.invalidate_ticket_cache()
+    webapp.invalidate_recent_time_entries(BENCH_USER_KEY)
+    # Rendered client portal pages, and the rate limit counters
+    listKeys = list(webapp.r.scan_iter(match=webapp.PORTAL_PAGE_PREFIX + "*")) + list(webapp.r.scan_iter(match=webapp.RATE_LIMIT_PREFIX + "*"))
+    if listKeys:
+        webapp.r.delete(*listKeys)
+
+##############
+# Timing
+##############
+
+# Nearest-rank percentile of a sorted list
+def percentile(listSorted, fPercent):
+    if not listSorted:
+        return 0.0
+    i = max(0, min(len(listSorted) - 1, int(round(fPercent / 100.0 * len(listSorted) + 0.5)) - 1))
+    return listSorted[i]
+
+# Form posted by the create_meeting_request route
+def time_entry_form(i):
+    return {
+        "subject": BENCH_CLIENT + "-000001 | " + BENCH_CLIENT + " | Bench entry " + str(i),
+        "start_time": "2024-01-01T09:00",
+        "end_time": "2024-01-01T09:30",
+        "body": "Benchmark time entry",
+        "clientID": BENCH_CLIENT,
+        "idempotency_key": "bench-" + str(time.time_ns()) + "-" + str(i),
+    }
+
+# Times iRequests requests to the route over iConcurrency clients.
+# bCold drops the caches before each request (so requests are serialized per client).
+def time_route(webapp, flaskApp, token, exchange, sMethod, sPath, iRequests, iConcurrency, bCold):
+    listLatencies = []
+    listStatus = []
+    lock = threading.Lock()
+    counter = iter(range(iRequests))
+
+    def worker():
+        client = make_client(webapp, flaskApp, token)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            if bCold:
+                drop_caches(webapp)
+            start = time.perf_counter()
+            if sMethod == "POST":
+                response = client.post(sPath, data=time_entry_form(i))
+            else:
+                response = client.get(sPath)
+            response.get_data()
+            fElapsed = time.perf_counter() - start
+            with lock:
+                listLatencies.append(fElapsed)
+                listStatus.append(response.status_code)
+
+    iCallsBefore = sum(exchange.calls.values())
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=iConcurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(iConcurrency)]:
+            future.result()
+    fWall = time.perf_counter() - wall_start
+    iCalls = sum(exchange.calls.values()) - iCallsBefore
+
+    listLatencies.sort()
+    return {
+        "p50": percentile(listLatencies, 50) * 1000,
+        "p90": percentile(listLatencies, 90) * 1000,
+        "p99": percentile(listLatencies, 99) * 1000,
+        "mean": sum(listLatencies) / len(listLatencies) * 1000,
+        "rps": len(listLatencies) / fWall,
+        "ews": iCalls / len(listLatencies),
+        "errors": sum(1 for iStatus in listStatus if iStatus >= 400),
+    }
+
+##############
+# Report
+##############
+
+HEADER = "{:<8} {:<24} {:<5} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7} {:>6}".format(
+    "tasks", "route", "cache", "p50 ms", "p90 ms", "p99 ms", "mean ms", "req/s", "ews/req", "errors")
+
+def format_row(iTasks, sRoute, sCache, result):
+    return "{:<8} {:<24} {:<5} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8.1f} {:>7.1f} {:>6}".format(
+        iTasks, sRoute, sCache, result["p50"], result["p90"], result["p99"], result["mean"], result["rps"],
+        result["ews"], result["errors"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WebTickets routes against a fake EWS server")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma separated task counts")
+    parser.add_argument("--calendar-items", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="requests per route and cache mode")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake server adds to every EWS call")
+    parser.add_argument("--routes", default=",".join(sName for sName, _, _ in ROUTES))
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_HOST/REDIS_PORT")
+    parser.add_argument("--output", default="bench_output.txt")
+    parser.add_argument("--startup", action="store_true", help="only check startup time with the network blocked")
+    parser.add_argument("--max-startup", type=float, default=2.0, help="seconds allowed for import + create_app()")
+    args = parser.parse_args()
+
+    fStartup, listAttempts = measure_startup()
+    sStartup = "Startup (import + create_app, no network): " + format(fStartup, ".3f") + "s"
+    print(sStartup)
+    if listAttempts:
+        sys.exit("Startup tried to use the network: " + ", ".join(listAttempts))
+    if fStartup > args.max_startup:
+        sys.exit("Startup took longer than " + str(args.max_startup) + "s")
+    if args.startup:
+        return
+
+    listSizes = [int(sSize) for sSize in args.sizes.split(",")]
+    listRoutes = [route for route in ROUTES if route[0] in args.routes.split(",")]
+
+    server, sEndpoint = fake_ews.serve(fake_ews.FakeExchange(0, 0))
+    webapp, flaskApp = load_app(sEndpoint, args.fake_redis)
+
+    listLines = ["WebTickets benchmark: " + str(args.requests) + " requests per row, concurrency "
+        + str(args.concurrency) + ", fake EWS latency " + str(args.latency) + "s", sStartup, HEADER]
+    print(listLines[0])
+    print(HEADER)
+
+    for iTasks in listSizes:
+        # Fresh data set and a clean redis for each size
+        exchange = fake_ews.FakeExchange(iTasks, args.calendar_items, args.latency)
+        server.exchange = exchange
+        webapp.r.flushdb()
+        token = seed_tokens(webapp)
+
+        for sName, sMethod, sPath in listRoutes:
+            for sCache in ("cold", "warm"):
+                # One untimed request so the warm run starts from a filled cache
+                if sCache == "warm":
+                    make_client(webapp, flaskApp, token).open(sPath, method=sMethod,
+                        data=time_entry_form(-1) if sMethod == "POST" else None).get_data()
+                result = time_route(webapp, flaskApp, token, exchange, sMethod, sPath, args.requests, args.concurrency, sCache == "cold")
+                sLine = format_row(iTasks, sName, sCache, result)
+                print(sLine)
+                listLines.append(sLine)
+
+    with open(args.output, "w") as fOutput:
+        fOutput.write("\n".join(listLines) + "\n")
+    print("Results written to " + args.output)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
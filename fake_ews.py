@@ -0,0 +1,541 @@
+# Local stand-in for the EWS SOAP endpoint, for benchmarking the routes without Exchange Online.
+# Serves a synthetic TB Tickets public folder (with the extended properties registered in app.py)
+# and one calendar per mailbox. Only the operations the app uses are implemented:
+# ConvertId (version check), GetFolder, FindFolder, FindItem, GetItem and CreateItem.
+# FindItem restrictions, sort orders and indexed paging are evaluated like EWS would.
+#
+# Run on its own:  python fake_ews.py --tasks 1000 --port 8765
+# and point the app at it with EWS_SERVICE_ENDPOINT=http://127.0.0.1:8765/EWS/Exchange.asmx
+# (plus OAUTHLIB_INSECURE_TRANSPORT=1 for plain http).
+
+###########
+# IMPORTS
+###########
+
+# INTERNAL:
+import argparse # For the command line
+import random # For the synthetic data
+import threading # For guarding the created items
+import uuid # For new item IDs
+from datetime import datetime, timedelta, timezone # For the synthetic dates
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # For serving EWS
+import xml.etree.ElementTree as ET # For reading and writing SOAP
+
+###############
+# GLOBALS
+###############
+
+SOAP_NS = "http://schemas.xmlsoap.org/soap/envelope/"
+M_NS = "http://schemas.microsoft.com/exchange/services/2006/messages"
+T_NS = "http://schemas.microsoft.com/exchange/services/2006/types"
+E_NS = "http://schemas.microsoft.com/exchange/services/2006/errors"
+
+ET.register_namespace("s", SOAP_NS)
+ET.register_namespace("m", M_NS)
+ET.register_namespace("t", T_NS)
+
+# Reported in every response header, so exchangelib doesn't have to guess further
+SERVER_VERSION = {"MajorVersion": "15", "MinorVersion": "20", "MajorBuildNumber": "7000",
+    "MinorBuildNumber": "0", "Version": "V2018_01_08"}
+
+# Public folder path of the tickets folder (matches TICKETS_FOLDER's default)
+TICKETS_PATH = ("TECHBLDRS INC", "TB Tickets")
+
+# Extended properties registered in app.py: property name -> type
+EXTENDED_PROPERTIES = {
+    ".DateCreated": "SystemTime",
+    ".Client": "String",
+    ".Assignee": "String",
+    ".HrsActualTotal": "Double",
+    ".DateLastActivity": "SystemTime",
+    ".Reason": "String",
+    ".TimeEntryJob": "String",
+}
+
+# Ticket categories, weighted roughly like the real folder (None: no categories at all)
+CATEGORIES = ([["1 New"]] * 8 + [["1 Re-Opened"]] + [["2 In Progress"]] * 6 + [["3 Waiting"]] * 3 + [["8 Time"]]
+    + [["9 REVIEW"]] + [["Place Holder"]] * 2 + [["2 In Progress", "8 Time"]] + [["1 New", "9 REVIEW"]] + [None])
+REASONS = ["Support"] * 5 + ["Billable"] * 3 + ["Project", "Internal"]
+
+def t(sTag):
+    return "{" + T_NS + "}" + sTag
+
+def m(sTag):
+    return "{" + M_NS + "}" + sTag
+
+def iso(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+##################
+# Synthetic Data
+##################
+
+# Builds iTasks tickets spread over iClients clients and iAssignees assignees (ids "aa", "ab", ...).
+# Each ticket is a dict of EWS field URI / extended property name -> value.
+def make_tasks(iTasks, iClients=50, iAssignees=20, seed=1):
+    rng = random.Random(seed)
+    listClients = ["C" + str(i).zfill(4) for i in range(iClients)]
+    listAssignees = [chr(97 + i // 26) + chr(97 + i % 26) for i in range(iAssignees)]
+    now = datetime.now(timezone.utc)
+
+    listTasks = []
+    for i in range(iTasks):
+        categories = rng.choice(CATEGORIES)
+        created = now - timedelta(days=rng.randint(0, 400), minutes=rng.randint(0, 1440))
+        client = rng.choice(listClients)
+        task = {
+            "item:ItemId": "task-" + str(i),
+            "item:ChangeKey": "ck-" + str(i),
+            # "<client>-<5 digit number>" puts the '#' marker at index 12 when present
+            "item:Subject": client + "-" + str(i).zfill(6) + ("#" if rng.random() < 0.05 else " ") + "| " + client + " | Ticket "
+                + str(i) + (" -2DEL-" if rng.random() < 0.02 else ""),
+            "item:Categories": categories,
+            ".DateCreated": iso(created),
+            ".Client": client,
+            ".Assignee": "" if "Place Holder" in (categories or []) else rng.choice(listAssignees),
+            ".HrsActualTotal": str(round(rng.random() * 20, 2)),
+            ".DateLastActivity": iso(created + timedelta(days=rng.randint(0, 30))),
+            ".Reason": rng.choice(REASONS),
+        }
+        listTasks.append(task)
+    return listTasks
+
+# Teams-style HTML body, the expensive kind for html2text
+TEAMS_BODY = ("<html><body><p>Worked on the ticket.</p>" + "<div>" + "<p>Notes line</p>" * 40 + "</div>"
+    + "<p>" + "_" * 80 + "</p><p>Microsoft Teams meeting</p><p>Join on your computer or mobile app</p></body></html>")
+
+# Builds iItems calendar items ending over the last few days
+def make_calendar(iItems, seed=1):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    listItems = []
+    for i in range(iItems):
+        end = now - timedelta(hours=rng.randint(1, 24 * 20))
+        listItems.append({
+            "item:ItemId": "cal-" + str(i),
+            "item:ChangeKey": "ck-cal-" + str(i),
+            "item:Subject": "C0001-" + str(i).zfill(6) + " | C0001 | Time entry " + str(i),
+            "item:Body": TEAMS_BODY if i % 2 == 0 else "Plain text notes for entry " + str(i),
+            "calendar:Start": iso(end - timedelta(minutes=rng.choice((15, 30, 60, 90)))),
+            "calendar:End": iso(end),
+            "calendar:Location": "",
+        })
+    return listItems
+
+################
+# Fake Server
+################
+
+# Holds the folders and items; shared by the request handler threads
+class FakeExchange:
+    def __init__(self, iTasks=1000, iCalendarItems=200, latency=0.0):
+        self.tasks = make_tasks(iTasks)
+        self.calendar = make_calendar(iCalendarItems)
+        self.latency = latency
+        # Back off (milliseconds) sent with ErrorServerBusy for every item operation while set,
+        # to reproduce Office 365 throttling
+        self.busy = None
+        # Number of CreateItem calls whose response is lost (the connection drops after the item
+        # was created), to reproduce a read timeout after Exchange already sent the invitation
+        self.lost_creates = 0
+        self.lock = threading.Lock()
+        # Folder ID -> (display name, folder class, parent ID)
+        self.folders = {
+            "pf-root": ("Public Folders Root", "IPF.Note", None),
+            "pf-techbldrs": (TICKETS_PATH[0], "IPF.Note", "pf-root"),
+            "pf-tickets": (TICKETS_PATH[1], "IPF.Task", "pf-techbldrs"),
+            "root": ("Root", "IPF.Note", None),
+            "calendar": ("Calendar", "IPF.Appointment", "root"),
+        }
+        self.calls = {}
+        self.iEdits = 0
+
+    def items_in(self, sFolderID):
+        if sFolderID == "pf-tickets":
+            return self.tasks, "Task"
+        if sFolderID == "calendar":
+            return self.calendar, "CalendarItem"
+        return [], "Item"
+
+    # Changes a task's fields (e.g. {".Assignee": "ab"}) and gives it a new change key, the way an
+    # edit in Outlook would. Returns the new change key.
+    def update_task(self, sItemID, dictFields):
+        with self.lock:
+            for task in self.tasks:
+                if task["item:ItemId"] == sItemID:
+                    task.update(dictFields)
+                    self.iEdits += 1
+                    task["item:ChangeKey"] = "ck-" + sItemID + "-edit-" + str(self.iEdits)
+                    return task["item:ChangeKey"]
+        raise KeyError(sItemID)
+
+    def count(self, sOperation):
+        with self.lock:
+            self.calls[sOperation] = self.calls.get(sOperation, 0) + 1
+
+#########################
+# Restrictions + Sorting
+#########################
+
+# Reads the field an element refers to: item:Subject, calendar:End or an extended property name
+def field_of(elem):
+    uri = elem.find(t("FieldURI"))
+    if uri is not None:
+        return uri.get("FieldURI")
+    ext = elem.find(t("ExtendedFieldURI"))
+    if ext is not None:
+        return ext.get("PropertyName")
+    return None
+
+def constant_of(elem):
+    const = elem.find(t("FieldURIOrConstant") + "/" + t("Constant"))
+    return const.get("Value") if const is not None else None
+
+# Compares as numbers when both sides are numbers, otherwise as strings (ISO dates sort as strings)
+def compare(a, b):
+    try:
+        a, b = float(a), float(b)
+    except (TypeError, ValueError):
+        a, b = str(a), str(b)
+    return (a > b) - (a < b)
+
+# Evaluates an EWS restriction element against an item
+def matches(elem, item):
+    tag = elem.tag.split("}")[1]
+    if tag in ("Restriction",):
+        return all(matches(child, item) for child in elem)
+    if tag == "And":
+        return all(matches(child, item) for child in elem)
+    if tag == "Or":
+        return any(matches(child, item) for child in elem)
+    if tag == "Not":
+        return not matches(elem[0], item)
+    if tag == "Exists":
+        return item.get(field_of(elem)) not in (None, "", [])
+
+    # Like Exchange: a restriction on a missing property is false (IsNotEqualTo included), and one on
+    # a multi-valued property (Categories) is true when it is true for any of the values
+    value = item.get(field_of(elem))
+    if value is None or value == []:
+        return False
+    values = value if isinstance(value, list) else [value]
+
+    if tag == "Contains":
+        const = elem.find(t("Constant")).get("Value")
+        bIgnoreCase = "IgnoreCase" in (elem.get("ContainmentComparison") or "")
+        for v in values:
+            if bIgnoreCase:
+                v, c = v.lower(), const.lower()
+            else:
+                c = const
+            sMode = elem.get("ContainmentMode") or "Substring"
+            if (sMode == "FullString" and v == c) or (sMode == "Prefixed" and v.startswith(c))\
+                    or (sMode in ("Substring", "PrefixOnWords", "ExactPhrase") and c in v):
+                return True
+        return False
+
+    const = constant_of(elem)
+    for v in values:
+        iCmp = compare(v, const)
+        if {
+            "IsEqualTo": iCmp == 0,
+            "IsNotEqualTo": iCmp != 0,
+            "IsGreaterThan": iCmp > 0,
+            "IsGreaterThanOrEqualTo": iCmp >= 0,
+            "IsLessThan": iCmp < 0,
+            "IsLessThanOrEqualTo": iCmp <= 0,
+        }[tag]:
+            return True
+    return False
+
+# Applies a SortOrder element (last field first, so the first field wins)
+def sort_items(listItems, sort_order):
+    if sort_order is None:
+        return listItems
+    for order in reversed(list(sort_order)):
+        sField = field_of(order)
+        bReverse = order.get("Order") == "Descending"
+        listItems = sorted(listItems, key=lambda item: str(item.get(sField) or ""), reverse=bReverse)
+    return listItems
+
+################
+# Serializing
+################
+
+# Fields to return: the item ID plus the AdditionalProperties asked for (all fields when none)
+def requested_fields(shape):
+    if shape is None:
+        return None
+    props = shape.find(t("AdditionalProperties"))
+    if props is None:
+        return None
+    return [prop.get("FieldURI") if prop.tag == t("FieldURI") else prop.get("PropertyName") for prop in props]
+
+def add_item(parent, item, sElement, listFields):
+    elem = ET.SubElement(parent, t(sElement))
+    ET.SubElement(elem, t("ItemId"), {"Id": item["item:ItemId"], "ChangeKey": item["item:ChangeKey"]})
+
+    for sField, value in item.items():
+        if sField in ("item:ItemId", "item:ChangeKey"):
+            continue
+        if listFields is not None and sField not in listFields:
+            continue
+        if sField.startswith(".") or value is None:
+            continue
+        sTag = sField.split(":")[1]
+        if sField == "item:Categories":
+            cats = ET.SubElement(elem, t("Categories"))
+            for sCategory in value:
+                ET.SubElement(cats, t("String")).text = sCategory
+        elif sField == "item:Body":
+            ET.SubElement(elem, t("Body"), {"BodyType": "HTML" if value.startswith("<html>") else "Text"}).text = value
+        else:
+            ET.SubElement(elem, t(sTag)).text = value
+
+    # Extended properties go last, like EWS returns them
+    for sName, sType in EXTENDED_PROPERTIES.items():
+        if sName not in item or (listFields is not None and sName not in listFields):
+            continue
+        if item[sName] in (None, ""):
+            continue
+        prop = ET.SubElement(elem, t("ExtendedProperty"))
+        ET.SubElement(prop, t("ExtendedFieldURI"), {"DistinguishedPropertySetId": "PublicStrings",
+            "PropertyName": sName, "PropertyType": sType})
+        ET.SubElement(prop, t("Value")).text = item[sName]
+
+def add_folder(parent, sFolderID, exchange):
+    sName, sClass, _ = exchange.folders[sFolderID]
+    listItems, _ = exchange.items_in(sFolderID)
+    sElement = "TasksFolder" if sClass == "IPF.Task" else ("CalendarFolder" if sClass == "IPF.Appointment" else "Folder")
+    elem = ET.SubElement(parent, t(sElement))
+    ET.SubElement(elem, t("FolderId"), {"Id": sFolderID, "ChangeKey": "ck-" + sFolderID})
+    if exchange.folders[sFolderID][2] is not None:
+        sParentID = exchange.folders[sFolderID][2]
+        ET.SubElement(elem, t("ParentFolderId"), {"Id": sParentID, "ChangeKey": "ck-" + sParentID})
+    ET.SubElement(elem, t("FolderClass")).text = sClass
+    ET.SubElement(elem, t("DisplayName")).text = sName
+    ET.SubElement(elem, t("TotalCount")).text = str(len(listItems))
+    iChildren = sum(1 for folder in exchange.folders.values() if folder[2] == sFolderID)
+    ET.SubElement(elem, t("ChildFolderCount")).text = str(iChildren)
+
+# Wraps the response messages in a SOAP envelope with the version header
+def envelope(sResponse, listMessages):
+    env = ET.Element("{" + SOAP_NS + "}Envelope")
+    header = ET.SubElement(env, "{" + SOAP_NS + "}Header")
+    ET.SubElement(header, t("ServerVersionInfo"), SERVER_VERSION)
+    body = ET.SubElement(env, "{" + SOAP_NS + "}Body")
+    response = ET.SubElement(body, m(sResponse))
+    messages = ET.SubElement(response, m("ResponseMessages"))
+    for message in listMessages:
+        messages.append(message)
+    return ET.tostring(env, xml_declaration=True, encoding="utf-8")
+
+# SOAP fault EWS sends (as HTTP 500) when it throttles a request
+def server_busy(iBackOffMs):
+    env = ET.Element("{" + SOAP_NS + "}Envelope")
+    body = ET.SubElement(env, "{" + SOAP_NS + "}Body")
+    fault = ET.SubElement(body, "{" + SOAP_NS + "}Fault")
+    ET.SubElement(fault, "faultcode").text = "a:ErrorServerBusy"
+    ET.SubElement(fault, "faultstring").text = "The server cannot service this request right now. Try again later."
+    detail = ET.SubElement(fault, "detail")
+    ET.SubElement(detail, "{" + E_NS + "}ResponseCode").text = "ErrorServerBusy"
+    ET.SubElement(detail, "{" + E_NS + "}Message").text = "The server cannot service this request right now. Try again later."
+    xml = ET.SubElement(detail, t("MessageXml"))
+    ET.SubElement(xml, t("Value"), {"Name": "BackOffMilliseconds"}).text = str(iBackOffMs)
+    return ET.tostring(env, xml_declaration=True, encoding="utf-8")
+
+def response_message(sName, sCode="NoError", sText=None):
+    msg = ET.Element(m(sName), {"ResponseClass": "Success" if sCode == "NoError" else "Error"})
+    if sText is not None:
+        ET.SubElement(msg, m("MessageText")).text = sText
+    ET.SubElement(msg, m("ResponseCode")).text = sCode
+    return msg
+
+###############
+# Operations
+###############
+
+# Resolves a FolderId / DistinguishedFolderId element to a folder ID of the fake exchange
+def folder_id_of(elem):
+    if elem.tag == t("DistinguishedFolderId"):
+        return {"publicfoldersroot": "pf-root"}.get(elem.get("Id"), elem.get("Id"))
+    return elem.get("Id")
+
+def op_convert_id(exchange, request):
+    return envelope("ConvertIdResponse", [response_message("ConvertIdResponseMessage", "ErrorInvalidIdMalformed", "Id is malformed.")])
+
+def op_get_folder(exchange, request):
+    listMessages = []
+    for elem in request.find(m("FolderIds")):
+        sFolderID = folder_id_of(elem)
+        if sFolderID not in exchange.folders:
+            listMessages.append(response_message("GetFolderResponseMessage", "ErrorFolderNotFound", "Folder not found."))
+            continue
+        msg = response_message("GetFolderResponseMessage")
+        add_folder(ET.SubElement(msg, m("Folders")), sFolderID, exchange)
+        listMessages.append(msg)
+    return envelope("GetFolderResponse", listMessages)
+
+def op_find_folder(exchange, request):
+    listMessages = []
+    for elem in request.find(m("ParentFolderIds")):
+        sParentID = folder_id_of(elem)
+        listChildren = [sID for sID, folder in exchange.folders.items() if folder[2] == sParentID]
+        msg = response_message("FindFolderResponseMessage")
+        root = ET.SubElement(msg, m("RootFolder"), {"IndexedPagingOffset": str(len(listChildren)),
+            "TotalItemsInView": str(len(listChildren)), "IncludesLastItemInRange": "true"})
+        folders = ET.SubElement(root, t("Folders"))
+        for sID in listChildren:
+            add_folder(folders, sID, exchange)
+        listMessages.append(msg)
+    return envelope("FindFolderResponse", listMessages)
+
+def op_find_item(exchange, request):
+    listMessages = []
+    listFields = requested_fields(request.find(m("ItemShape")))
+    restriction = request.find(m("Restriction"))
+    sort_order = request.find(m("SortOrder"))
+    page = request.find(m("IndexedPageItemView"))
+
+    for elem in request.find(m("ParentFolderIds")):
+        sFolderID = folder_id_of(elem)
+        if sFolderID not in exchange.folders:
+            listMessages.append(response_message("FindItemResponseMessage", "ErrorFolderNotFound", "Folder not found."))
+            continue
+
+        listItems, sElement = exchange.items_in(sFolderID)
+        with exchange.lock:
+            listItems = list(listItems)
+        if restriction is not None:
+            listItems = [item for item in listItems if matches(restriction, item)]
+        listItems = sort_items(listItems, sort_order)
+
+        iTotal = len(listItems)
+        iOffset = int(page.get("Offset", "0")) if page is not None else 0
+        iMax = int(page.get("MaxEntriesReturned", "1000")) if page is not None else 1000
+        listPage = listItems[iOffset:iOffset + iMax]
+
+        msg = response_message("FindItemResponseMessage")
+        root = ET.SubElement(msg, m("RootFolder"), {"IndexedPagingOffset": str(iOffset + len(listPage)),
+            "TotalItemsInView": str(iTotal), "IncludesLastItemInRange": "true" if iOffset + len(listPage) >= iTotal else "false"})
+        items = ET.SubElement(root, t("Items"))
+        for item in listPage:
+            add_item(items, item, sElement, listFields)
+        listMessages.append(msg)
+    return envelope("FindItemResponse", listMessages)
+
+def op_get_item(exchange, request):
+    listFields = requested_fields(request.find(m("ItemShape")))
+    dictItems = {item["item:ItemId"]: (item, "CalendarItem") for item in exchange.calendar}
+    dictItems.update({item["item:ItemId"]: (item, "Task") for item in exchange.tasks})
+    listMessages = []
+    for elem in request.find(m("ItemIds")):
+        found = dictItems.get(elem.get("Id"))
+        if found is None:
+            listMessages.append(response_message("GetItemResponseMessage", "ErrorItemNotFound", "Item not found."))
+            continue
+        msg = response_message("GetItemResponseMessage")
+        add_item(ET.SubElement(msg, m("Items")), found[0], found[1], listFields)
+        listMessages.append(msg)
+    return envelope("GetItemResponse", listMessages)
+
+def op_create_item(exchange, request):
+    listMessages = []
+    for elem in request.find(m("Items")):
+        sID = "cal-new-" + uuid.uuid4().hex
+        item = {"item:ItemId": sID, "item:ChangeKey": "ck-" + sID}
+        for child in elem:
+            sTag = child.tag.split("}")[1]
+            if sTag in ("Subject", "Body"):
+                item["item:" + sTag] = child.text or ""
+            elif sTag in ("Start", "End", "Location"):
+                item["calendar:" + sTag] = child.text or ""
+            elif sTag == "ExtendedProperty":
+                item[field_of(child)] = child.find(t("Value")).text
+        with exchange.lock:
+            exchange.calendar.append(item)
+        msg = response_message("CreateItemResponseMessage")
+        items = ET.SubElement(msg, m("Items"))
+        created = ET.SubElement(items, t(elem.tag.split("}")[1]))
+        ET.SubElement(created, t("ItemId"), {"Id": sID, "ChangeKey": item["item:ChangeKey"]})
+        listMessages.append(msg)
+    return envelope("CreateItemResponse", listMessages)
+
+OPERATIONS = {
+    "ConvertId": op_convert_id,
+    "GetFolder": op_get_folder,
+    "FindFolder": op_find_folder,
+    "FindItem": op_find_item,
+    "GetItem": op_get_item,
+    "CreateItem": op_create_item,
+}
+
+# Operations answered with ErrorServerBusy while FakeExchange.busy is set
+THROTTLED_OPERATIONS = ("FindItem", "GetItem", "CreateItem")
+
+##################
+# HTTP Handling
+##################
+
+# The exchange being served is server.exchange, so it can be swapped between benchmark runs
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        exchange = self.server.exchange
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        request = ET.fromstring(body).find("{" + SOAP_NS + "}Body")[0]
+        sOperation = request.tag.split("}")[1]
+        exchange.count(sOperation)
+
+        fnOperation = OPERATIONS.get(sOperation)
+        if fnOperation is None:
+            self.send_error(501, "Operation not implemented by fake_ews: " + sOperation)
+            return
+
+        if exchange.latency:
+            threading.Event().wait(exchange.latency)
+
+        if exchange.busy is not None and sOperation in THROTTLED_OPERATIONS:
+            payload = server_busy(exchange.busy)
+            self.send_response(500)
+        else:
+            payload = fnOperation(exchange, request)
+            if sOperation == "CreateItem" and exchange.lost_creates:
+                with exchange.lock:
+                    exchange.lost_creates -= 1
+                # Hang up without answering
+                self.close_connection = True
+                return
+            self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # Quiet, the benchmark prints its own report
+    def log_message(self, format, *args):
+        pass
+
+# Starts the fake server on a background thread, returns (server, endpoint URL)
+def serve(exchange, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.exchange = exchange
+    threading.Thread(target=server.serve_forever, name="fake-ews", daemon=True).start()
+    return server, "http://" + host + ":" + str(server.server_address[1]) + "/EWS/Exchange.asmx"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake EWS server with a synthetic TB Tickets folder")
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--calendar-items", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every EWS call")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server, sEndpoint = serve(FakeExchange(args.tasks, args.calendar_items, args.latency), port=args.port)
+    print("Fake EWS listening on " + sEndpoint)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
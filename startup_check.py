@@ -0,0 +1,56 @@
+# Worker startup check: imports app.py and runs create_app() in a fresh interpreter with the
+# network blocked, timing it and recording every attempt to connect or resolve a host name.
+# Shared by bench.py (which reports and enforces the time) and tests/test_startup.py.
+
+###########
+# IMPORTS
+###########
+
+# INTERNAL:
+import os # For the check's environment
+import sys # For running the check with this interpreter
+import json # For reading back the check's result
+import subprocess # For running the check in a fresh interpreter
+
+###############
+# GLOBALS
+###############
+
+# Directory holding app.py
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a fresh interpreter so the blocked sockets don't leak into the caller.
+# Every attempt is recorded, app.py may catch the OSError and carry on.
+STARTUP_SCRIPT = """
+import json, socket, time
+listAttempts = []
+def blocked(sName):
+    def fnBlocked(*args, **kwargs):
+        listAttempts.append(sName + repr(args[1:] if sName == "connect" else args))
+        raise OSError("network access during startup")
+    return fnBlocked
+socket.socket.connect = blocked("connect")
+socket.socket.connect_ex = blocked("connect")
+socket.create_connection = blocked("create_connection")
+socket.getaddrinfo = blocked("getaddrinfo")
+start = time.perf_counter()
+import app
+app.create_app({"SECRET_KEY": "startup"})
+print(json.dumps({"seconds": time.perf_counter() - start, "attempts": listAttempts}))
+"""
+
+####################
+# Startup Check
+####################
+
+# Returns (seconds to import app.py and build the app, list of the network attempts made).
+# Raises if startup fails.
+def measure_startup():
+    env = dict(os.environ, AUTHORITY="https://login.microsoftonline.com/startup-check", REDIS_HOST="redis.invalid")
+    result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=APP_DIR, env=env,
+        capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError("startup failed without network:\n" + result.stderr)
+
+    dictResult = json.loads(result.stdout.strip().splitlines()[-1])
+    return dictResult["seconds"], dictResult["attempts"]
@@ -0,0 +1,103 @@
+// Keeps an open ticket list up to date from its /live/<assignee|client>/<ID> stream (Server-Sent Events).
+// Rows in #ticket-rows carry data-ticket-id. Changed tickets are patched in place, new tickets are
+// added at the top (built from a copy of an existing row) and removed tickets are dropped.
+
+// Same text as the template's {{ task.Category }} (a Python list)
+function formatCategories(categories) {
+    if (!categories) {
+        return "None";
+    }
+    return "[" + categories.map(function (category) { return "'" + category + "'"; }).join(", ") + "]";
+}
+
+// Fills a row with the ticket's values, including the time entry form that is keyed by subject
+function fillTicketRow(row, ticket) {
+    var cells = row.cells;
+    var values = [ticket.subject, formatCategories(ticket.categories), ticket.date_created, ticket.last_activity];
+    var reopened = (ticket.categories || []).indexOf("1 Re-Opened") !== -1;
+    for (var i = 0; i < values.length; i++) {
+        cells[i].textContent = values[i] === null ? "None" : values[i];
+        if (cells[i].classList.contains("reopened") || reopened) {
+            cells[i].classList.toggle("reopened", reopened);
+        }
+    }
+
+    var popup = row.querySelector(".form-popup");
+    if (popup && popup.id !== ticket.subject) {
+        popup.id = ticket.subject;
+        var subject = popup.querySelector('input[name="subject"]');
+        if (subject) {
+            subject.value = ticket.subject.split("|").slice(0, 3).join("|") + "| ";
+        }
+        var key = popup.querySelector('input[name="idempotency_key"]');
+        if (key) {
+            key.value = "";
+        }
+        row.querySelector("td > button").onclick = function () { openForm(ticket.subject); };
+        popup.querySelector('button[onclick^="closeForm"]').onclick = function () { closeForm(ticket.subject); };
+    }
+    row.dataset.ticketId = ticket.id;
+}
+
+// Shows a notice asking for a reload (changes may have been missed)
+function showReloadNotice(sText) {
+    if (document.getElementById("live-notice")) {
+        return;
+    }
+    var notice = document.createElement("div");
+    notice.id = "live-notice";
+    notice.className = "stale-notice";
+    notice.textContent = sText + " ";
+    var link = document.createElement("a");
+    link.href = window.location.href;
+    link.textContent = "Reload";
+    notice.appendChild(link);
+    var rows = document.getElementById("ticket-rows");
+    var table = rows.closest("table");
+    table.parentNode.insertBefore(notice, table);
+}
+
+function applyTicketEvent(message) {
+    var rows = document.getElementById("ticket-rows");
+    if (message.type === "reset") {
+        showReloadNotice("Tickets may have changed.");
+        return;
+    }
+    var sSelector = 'tr[data-ticket-id="' + CSS.escape(message.type === "delete" ? message.id : message.ticket.id) + '"]';
+    var existing = rows.querySelectorAll(sSelector);
+
+    if (message.type === "delete") {
+        existing.forEach(function (row) { row.remove(); });
+        return;
+    }
+
+    if (existing.length) {
+        existing.forEach(function (row) { fillTicketRow(row, message.ticket); });
+        return;
+    }
+
+    // New on this list: copy the first row for the markup
+    var template = rows.querySelector("tr[data-ticket-id]");
+    if (!template) {
+        showReloadNotice("New tickets.");
+        return;
+    }
+    var row = template.cloneNode(true);
+    var popup = row.querySelector(".form-popup");
+    if (popup) {
+        popup.style.display = "none";
+        popup.id = "";
+    }
+    fillTicketRow(row, message.ticket);
+    rows.insertBefore(row, rows.firstChild);
+}
+
+function watchTickets(sURL) {
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource(sURL);
+    source.addEventListener("ticket", function (event) {
+        applyTicketEvent(JSON.parse(event.data));
+    });
+}
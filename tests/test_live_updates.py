@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from exchangelib.errors import ErrorItemNotFound
+
+import app
+from ticket_notifications import TicketNotifier, FakeNotificationSource
+
+####
+# Helpers
+####
+
+# Task-like item, as account.fetch() returns it
+def make_task(sID, sChangeKey, client="C0001", assignee=None, categories=("1 New",)):
+    return SimpleNamespace(id=sID, changekey=sChangeKey, subject="C0001 | Ticket " + sID, categories=list(categories),
+        dateCreated_property=datetime(2024, 1, 1, tzinfo=timezone.utc), client_property=client,
+        assignee_property=assignee, hrsActualTotal_property=Decimal("1.5"),
+        datelastactivity_property=datetime(2024, 1, 2, tzinfo=timezone.utc))
+
+# Service account stand-in: fetch() answers from dictTasks, missing IDs come back as errors like EWS
+class FakeAccount:
+    def __init__(self):
+        self.dictTasks = {}
+
+    def fetch(self, ids, folder=None, only_fields=None):
+        return [self.dictTasks.get(sID) or ErrorItemNotFound("not found") for sID, _ in ids]
+
+@pytest.fixture
+def live(monkeypatch):
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(app, "r", redis)
+    monkeypatch.setattr(app, "ticketNotifier", TicketNotifier(redis))
+    monkeypatch.setattr(app, "ewsCircuit", app.CircuitBreaker(redis))
+    monkeypatch.setattr(app, "get_tickets_folder", lambda account, refresh=False: None)
+
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe("webtickets:live:channel:*")
+    # Reads the subscribe confirmation, so run() stops at the first missing message
+    pubsub.get_message(timeout=0.1)
+    return SimpleNamespace(redis=redis, pubsub=pubsub, account=FakeAccount(), source=FakeNotificationSource(0.01))
+
+# Runs the batches pushed to the fake source through apply_ticket_changes, like watch_ticket_folder.
+# Returns the published (channel, message type) pairs.
+def run(live):
+    live.source.close()
+    for listChanges in live.source.batches():
+        if listChanges:
+            app.apply_ticket_changes(live.account, listChanges)
+
+    setPublished = set()
+    while True:
+        message = live.pubsub.get_message(timeout=0.1)
+        if message is None:
+            return setPublished
+        sChannel = message["channel"].decode()[len("webtickets:live:channel:"):]
+        setPublished.add((sChannel, json.loads(message["data"])["type"]))
+
+# Fills the ticket caches the changes may drop
+def seed_caches(redis, listKeys):
+    for sKey in listKeys:
+        redis.set(sKey, "[]")
+
+####
+# Live updates
+####
+
+def test_assignee_move_publishes_delete_and_upsert(live):
+    live.account.dictTasks["t1"] = make_task("t1", "ck1", assignee="aa")
+    live.source.push(("upsert", "t1", "ck1"))
+    # Not seen before, so its delete goes to every page
+    assert run(live) == {("all", "delete"), ("client:C0001", "upsert"), ("assignee:aa", "upsert")}
+
+    seed_caches(live.redis, [app.ticket_cache_key("assignee", "aa"), app.ticket_cache_key("assignee", "ab"),
+        app.ticket_cache_key("assignee", "ac"), app.ticket_cache_key("client", "C0001"),
+        app.ticket_cache_key("client", "C0002"), app.PORTAL_PAGE_PREFIX + "C0001"])
+    live.account.dictTasks["t1"] = make_task("t1", "ck2", assignee="ab")
+    live.source = FakeNotificationSource(0.01)
+    live.source.push(("upsert", "t1", "ck2"))
+    assert run(live) == {("assignee:aa", "delete"), ("assignee:ab", "upsert"), ("client:C0001", "upsert")}
+
+    assert not live.redis.exists(app.ticket_cache_key("assignee", "aa"))
+    assert not live.redis.exists(app.ticket_cache_key("assignee", "ab"))
+    assert not live.redis.exists(app.ticket_cache_key("client", "C0001"))
+    assert not live.redis.exists(app.PORTAL_PAGE_PREFIX + "C0001")
+    assert live.redis.exists(app.ticket_cache_key("assignee", "ac"))
+    assert live.redis.exists(app.ticket_cache_key("client", "C0002"))
+
+def test_review_ticket_drops_off(live):
+    live.account.dictTasks["t1"] = make_task("t1", "ck1", assignee="aa")
+    live.source.push(("upsert", "t1", "ck1"))
+    run(live)
+
+    live.account.dictTasks["t1"] = make_task("t1", "ck2", assignee="aa", categories=["9 REVIEW"])
+    live.source = FakeNotificationSource(0.01)
+    live.source.push(("upsert", "t1", "ck2"))
+    assert run(live) == {("client:C0001", "delete"), ("assignee:aa", "delete")}
+    assert app.ticketNotifier.last_channels("t1") is None
+
+def test_placeholder_delete_and_vanished_items(live):
+    live.account.dictTasks["t2"] = make_task("t2", "ck1", client="C0002", categories=["Place Holder"])
+    live.source.push(("upsert", "t2", "ck1"))
+    assert run(live) == {("all", "delete"), ("client:C0002", "upsert"), ("placeholder", "upsert")}
+
+    seed_caches(live.redis, [app.ticket_cache_key("placeholder", ""), app.ticket_cache_key("client", "C0002")])
+    live.source = FakeNotificationSource(0.01)
+    # t3 was deleted before it could be fetched
+    live.source.push(("delete", "t2", None), ("upsert", "t3", "ck1"))
+    assert run(live) == {("client:C0002", "delete"), ("placeholder", "delete"), ("all", "delete")}
+    assert not live.redis.exists(app.ticket_cache_key("placeholder", ""))
+    assert not live.redis.exists(app.ticket_cache_key("client", "C0002"))
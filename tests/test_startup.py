@@ -0,0 +1,13 @@
+from startup_check import measure_startup
+
+####
+# Startup
+# Importing app.py and building the app must not touch the network (EWS, MSAL, redis)
+####
+
+MAX_STARTUP_SECONDS = 2
+
+def test_startup_without_network():
+    fSeconds, listAttempts = measure_startup()
+    assert listAttempts == []
+    assert fSeconds < MAX_STARTUP_SECONDS
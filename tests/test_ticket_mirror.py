@@ -0,0 +1,106 @@
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import app
+from ticket_mirror import TicketMirror, RecordedSyncFolder
+
+####
+# Helpers
+####
+
+# Task-like item, as exchangelib's sync_items() yields it
+def make_task(sID, sChangeKey="ck1", client=None, assignee=None, dateCreated=None, subject="Ticket"):
+    return SimpleNamespace(id=sID, changekey=sChangeKey, subject=subject, categories=["1 New"],
+        dateCreated_property=dateCreated, client_property=client, assignee_property=assignee,
+        hrsActualTotal_property=Decimal("1.5"), datelastactivity_property=None, reason_property=None)
+
+def ids(listRows):
+    return sorted(row["id"] for row in listRows)
+
+@pytest.fixture
+def mirror(monkeypatch):
+    ticketMirror = TicketMirror(fakeredis.FakeRedis())
+    # query_mirror reads the module's mirror
+    monkeypatch.setattr(app, "ticketMirror", ticketMirror)
+    return ticketMirror
+
+####
+# Sync
+####
+
+def test_sync_applies_changes(mirror):
+    folder = RecordedSyncFolder([
+        [
+            ("create", make_task("t1", client="C0001", assignee="aa")),
+            ("create", make_task("t2", client="C0001", assignee="ab")),
+            ("create", make_task("t3", client="C0002")),
+        ],
+        [
+            # Moves to another client and assignee
+            ("update", make_task("t1", "ck2", client="C0002", assignee="ab", subject="Moved")),
+            ("delete", SimpleNamespace(id="t3", changekey=None)),
+            ("read_flag_change", SimpleNamespace(id="t2", changekey=None)),
+            # Already gone
+            ("delete", SimpleNamespace(id="t9", changekey=None)),
+        ],
+    ])
+
+    assert not mirror.is_ready()
+    assert mirror.sync(folder) == 3
+    assert mirror.is_ready()
+    assert mirror.redis.get(mirror.key("state")) == b"recorded-1"
+    assert ids(mirror.query(client="C0001")) == ["t1", "t2"]
+    assert ids(mirror.query(assignee="")) == ["t3"]
+    assert ids(mirror.query(client="C0001", assignee="aa")) == ["t1"]
+
+    # read_flag_change isn't counted, deleting an unknown item is
+    assert mirror.sync(folder) == 3
+    assert mirror.redis.get(mirror.key("state")) == b"recorded-2"
+    assert ids(mirror.query()) == ["t1", "t2"]
+    assert ids(mirror.query(client="C0001")) == ["t2"]
+    assert ids(mirror.query(client="C0002")) == ["t1"]
+    assert ids(mirror.query(assignee="aa")) == []
+    assert ids(mirror.query(assignee="ab")) == ["t1", "t2"]
+    assert ids(mirror.query(assignee="")) == []
+
+    row = mirror.query(client="C0002")[0]
+    assert (row["changekey"], row["subject"], row["hrsActualTotal_property"]) == ("ck2", "Moved", "1.5")
+
+    # Nothing new
+    assert mirror.sync(folder) == 0
+    assert mirror.age() < 5
+
+def test_reset(mirror):
+    mirror.sync(RecordedSyncFolder([[("create", make_task("t1", client="C0001", assignee="aa"))]]))
+    mirror.reset()
+    assert not mirror.is_ready()
+    assert mirror.query() == []
+
+####
+# Sort order
+# EWS sorts missing values before any value, so they come first ascending and last descending
+####
+
+def test_query_mirror_sorts_like_ews(mirror):
+    mirror.sync(RecordedSyncFolder([[
+        ("create", make_task("a-old", client="C0001", assignee="aa", dateCreated=datetime(2024, 1, 1))),
+        ("create", make_task("a-new", client="C0001", assignee="aa", dateCreated=datetime(2024, 3, 1))),
+        ("create", make_task("a-none", client="C0001", assignee="aa")),
+        ("create", make_task("b-mid", client="C0002", assignee="aa", dateCreated=datetime(2024, 2, 1))),
+        ("create", make_task("none-old", assignee="aa", dateCreated=datetime(2023, 1, 1))),
+    ]]))
+
+    listTasks = app.query_mirror(order_by=app.TICKET_ORDER, assignee_property__exact="aa")
+    assert [task.id for task in listTasks] == ["b-mid", "a-none", "a-old", "a-new", "none-old"]
+    assert isinstance(listTasks[2].dateCreated_property, datetime)
+
+    listTasks = app.query_mirror(assignee_property__exact="aa")
+    assert [task.id for task in listTasks] == ["none-old", "a-new", "a-old", "a-none", "b-mid"]
+
+    listTasks = app.query_mirror(order_by=('-dateCreated_property',), client_property__exact="C0001")
+    assert [task.id for task in listTasks] == ["a-new", "a-old", "a-none"]
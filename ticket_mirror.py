@@ -0,0 +1,177 @@
+# Local mirror of the TB Tickets folder, kept up to date with EWS SyncFolderItems.
+# Only the fields the routes use are stored, in redis, with an index per client and per assignee.
+# Each sync cycle pulls only the changes since the last stored sync state token.
+
+###########
+# IMPORTS
+###########
+
+# INTERNAL:
+import json # For serializing mirrored tickets
+import time # For tracking when the mirror was last synced
+from decimal import Decimal # For Double extended properties
+
+###############
+# GLOBALS
+###############
+
+# Task fields requested from SyncFolderItems (registered extended properties in app.py)
+MIRROR_FIELDS = (
+    "subject",
+    "categories",
+    "dateCreated_property",
+    "client_property",
+    "assignee_property",
+    "hrsActualTotal_property",
+    "datelastactivity_property",
+    "reason_property",
+)
+
+# Fields holding datetimes, stored as ISO strings
+MIRROR_DATE_FIELDS = ("dateCreated_property", "datelastactivity_property")
+
+# Max changes per SyncFolderItems call (EWS allows up to 512)
+MIRROR_PAGE_SIZE = 512
+
+##################
+# Ticket Mirror
+##################
+
+# Redis layout (prefix defaults to "webtickets:mirror:"):
+#   items             hash: item ID -> JSON row
+#   client:<ID>       set of item IDs for the client
+#   assignee:<ID>     set of item IDs for the assignee ("" for unassigned)
+#   state             SyncFolderItems state token
+#   synced_at         unix time of the last completed sync
+class TicketMirror:
+    def __init__(self, redis, prefix="webtickets:mirror:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    def key(self, sName):
+        return self.prefix + sName
+
+    # Turns a synced Task into the stored row
+    @staticmethod
+    def to_row(item):
+        row = {"id": item.id, "changekey": item.changekey}
+        for sField in MIRROR_FIELDS:
+            value = getattr(item, sField, None)
+            if sField in MIRROR_DATE_FIELDS and value is not None:
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            row[sField] = value
+        return row
+
+    # True once a full sync has completed
+    def is_ready(self):
+        return self.redis.exists(self.key("state")) == 1
+
+    # Seconds since the last completed sync (None if never synced)
+    def age(self):
+        synced_at = self.redis.get(self.key("synced_at"))
+        if synced_at is None:
+            return None
+        return time.time() - float(synced_at)
+
+    # Adds or replaces a row, moving it between the client/assignee indexes if they changed
+    def put(self, row, pipe):
+        old = self.redis.hget(self.key("items"), row["id"])
+        if old is not None:
+            old = json.loads(old)
+            pipe.srem(self.key("client:" + (old["client_property"] or "")), row["id"])
+            pipe.srem(self.key("assignee:" + (old["assignee_property"] or "")), row["id"])
+        pipe.hset(self.key("items"), row["id"], json.dumps(row))
+        pipe.sadd(self.key("client:" + (row["client_property"] or "")), row["id"])
+        pipe.sadd(self.key("assignee:" + (row["assignee_property"] or "")), row["id"])
+
+    # Removes a row and its index entries
+    def remove(self, sItemID, pipe):
+        old = self.redis.hget(self.key("items"), sItemID)
+        if old is None:
+            return
+        old = json.loads(old)
+        pipe.srem(self.key("client:" + (old["client_property"] or "")), sItemID)
+        pipe.srem(self.key("assignee:" + (old["assignee_property"] or "")), sItemID)
+        pipe.hdel(self.key("items"), sItemID)
+
+    # Applies a SyncFolderItems change stream: an iterable of (change_type, item) tuples,
+    # as yielded by exchangelib's Folder.sync_items() (or a recorded/fake stream).
+    # Returns the number of changes applied.
+    def apply(self, changes):
+        iApplied = 0
+        for change_type, item in changes:
+            pipe = self.redis.pipeline()
+            if change_type in ("create", "update"):
+                self.put(self.to_row(item), pipe)
+            elif change_type == "delete":
+                self.remove(item.id, pipe)
+            else:
+                # read_flag_change doesn't touch any mirrored field
+                continue
+            pipe.execute()
+            iApplied += 1
+        return iApplied
+
+    # Pulls the changes since the last sync from the folder and stores the new state token.
+    # folder is anything with exchangelib's sync_items() / item_sync_state interface.
+    def sync(self, folder):
+        state = self.redis.get(self.key("state"))
+        if state is not None:
+            state = state.decode()
+
+        changes = folder.sync_items(sync_state=state, only_fields=MIRROR_FIELDS, max_changes_returned=MIRROR_PAGE_SIZE)
+        iApplied = self.apply(changes)
+
+        # sync_items() updates item_sync_state once the stream is exhausted
+        self.redis.set(self.key("state"), folder.item_sync_state)
+        self.redis.set(self.key("synced_at"), time.time())
+        return iApplied
+
+    # Drops the whole mirror so the next sync starts from scratch
+    def reset(self):
+        listKeys = list(self.redis.scan_iter(match=self.prefix + "*"))
+        if listKeys:
+            self.redis.delete(*listKeys)
+
+    # Returns the rows for a client and/or assignee (both given: rows matching both)
+    def query(self, client=None, assignee=None):
+        listSets = []
+        if client is not None:
+            listSets.append(self.key("client:" + client))
+        if assignee is not None:
+            listSets.append(self.key("assignee:" + assignee))
+
+        if listSets:
+            listIDs = list(self.redis.sinter(listSets))
+            if not listIDs:
+                return []
+            listRows = self.redis.hmget(self.key("items"), listIDs)
+        else:
+            listRows = self.redis.hvals(self.key("items"))
+
+        return [json.loads(row) for row in listRows if row is not None]
+
+#########################
+# Recorded Sync Stream
+#########################
+
+# Stand-in for an exchangelib folder that replays recorded SyncFolderItems batches,
+# one batch per sync() call. Lets the mirror be exercised without an EWS server.
+#   batches: list of lists of (change_type, item) tuples
+class RecordedSyncFolder:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.item_sync_state = None
+        self.iBatch = 0
+
+    def sync_items(self, sync_state=None, only_fields=None, max_changes_returned=None):
+        if self.iBatch < len(self.batches):
+            batch = self.batches[self.iBatch]
+            self.iBatch += 1
+        else:
+            batch = []
+        for change in batch:
+            yield change
+        self.item_sync_state = "recorded-" + str(self.iBatch)
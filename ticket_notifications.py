@@ -0,0 +1,230 @@
+# Live ticket updates: one EWS streaming subscription on the TB Tickets folder, fanned out to
+# the open ticket pages through redis pub/sub (one channel per client, per assignee and for the
+# 'Place Holder' list) and Server-Sent Events.
+# The notification sources only report which items changed; app.py fetches the changed tickets,
+# works out the channels they show up in, and hands them to TicketNotifier.publish_upsert/delete.
+
+###########
+# IMPORTS
+###########
+
+# INTERNAL:
+import json # For serializing published events
+import queue # For the per-connection event queues
+import threading # For the pub/sub listener thread
+import time # For backing off after a lost redis connection
+
+###############
+# GLOBALS
+###############
+
+# Channel every page listens to, for events that can't be routed to a channel (see publish_upsert)
+BROADCAST_CHANNEL = "all"
+
+##########################
+# Notification Sources
+##########################
+
+# Turns a streaming Notification's events into changes to the watched folder:
+# a list of ("upsert" | "delete", item ID, change key) tuples (change key None for deletes).
+# Moves count as a delete from the folder they left and an upsert in the folder they landed in.
+def changes_from_events(listEvents, sFolderID):
+    listChanges = []
+    for event in listEvents:
+        sEvent = type(event).__name__
+        if getattr(event, "item_id", None) is None and getattr(event, "old_item_id", None) is None:
+            # Folder events, status (heartbeat) events
+            continue
+        if sEvent in ("CreatedEvent", "ModifiedEvent", "CopiedEvent"):
+            listChanges.append(("upsert", event.item_id.id, event.item_id.changekey))
+        elif sEvent == "DeletedEvent":
+            listChanges.append(("delete", event.item_id.id, None))
+        elif sEvent == "MovedEvent":
+            if event.old_parent_folder_id is not None and event.old_parent_folder_id.id == sFolderID:
+                listChanges.append(("delete", event.old_item_id.id, None))
+            if event.parent_folder_id is not None and event.parent_folder_id.id == sFolderID:
+                listChanges.append(("upsert", event.item_id.id, event.item_id.changekey))
+    return listChanges
+
+# Streaming subscription on an exchangelib folder.
+# batches() subscribes, then yields one list of changes per notification, plus an empty list each
+# time a streaming connection closes (every iConnectionTimeout minutes when nothing happens),
+# so the caller gets a chance to check it should keep going. Errors (an expired subscription,
+# missed events) end the generator; the caller should treat everything it published as suspect
+# and subscribe again.
+class StreamingNotificationSource:
+    def __init__(self, folder, iConnectionTimeout=1):
+        self.folder = folder
+        self.iConnectionTimeout = iConnectionTimeout
+
+    def batches(self):
+        sSubscriptionID = self.folder.subscribe_to_streaming()
+        try:
+            while True:
+                for notification in self.folder.get_streaming_events(sSubscriptionID, connection_timeout=self.iConnectionTimeout):
+                    listChanges = changes_from_events(notification.events, self.folder.id)
+                    if listChanges:
+                        yield listChanges
+                yield []
+        finally:
+            try:
+                self.folder.unsubscribe(sSubscriptionID)
+            except Exception:
+                # Already expired on the server
+                pass
+
+# Stand-in notification source for tests and the fake EWS server: changes pushed with push()
+# come out of batches() one batch at a time. close() ends batches().
+class FakeNotificationSource:
+    def __init__(self, fIdleTimeout=1.0):
+        self.queue = queue.Queue()
+        self.fIdleTimeout = fIdleTimeout
+
+    # Queues one batch: push(("upsert", "task-1", "ck-1"), ("delete", "task-2", None))
+    def push(self, *changes):
+        self.queue.put(list(changes))
+
+    def close(self):
+        self.queue.put(None)
+
+    def batches(self):
+        while True:
+            try:
+                listChanges = self.queue.get(timeout=self.fIdleTimeout)
+            except queue.Empty:
+                # Same as a streaming connection closing with nothing to report
+                yield []
+                continue
+            if listChanges is None:
+                return
+            yield listChanges
+
+###################
+# Ticket Notifier
+###################
+
+# Redis layout (prefix defaults to "webtickets:live:"):
+#   channel:<name>    pub/sub channel, e.g. channel:client:C0001, channel:assignee:aa,
+#                     channel:placeholder, channel:all
+#   items             hash: item ID -> JSON list of the channels the ticket was last shown in
+# Published messages are JSON:
+#   {"type": "upsert", "ticket": {...Ticket.to_json()...}}
+#   {"type": "delete", "id": "<item ID>"}
+#   {"type": "reset"}   (changes may have been missed, pages should reload)
+class TicketNotifier:
+    def __init__(self, redis, prefix="webtickets:live:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    def key(self, sName):
+        return self.prefix + sName
+
+    def channel(self, sName):
+        return self.prefix + "channel:" + sName
+
+    # Channels the item was last published to (None if it hasn't been seen yet)
+    def last_channels(self, sItemID):
+        listChannels = self.redis.hget(self.key("items"), sItemID)
+        if listChannels is None:
+            return None
+        return json.loads(listChannels)
+
+    # Publishes a changed ticket to the channels it now shows up in, and a delete to the channels
+    # it dropped out of. Tickets not seen before get their delete on the broadcast channel, since
+    # the pages they were on aren't known. Returns every channel the change touched.
+    def publish_upsert(self, sItemID, listChannels, dictTicket):
+        listOld = self.last_channels(sItemID)
+        sDelete = json.dumps({"type": "delete", "id": sItemID})
+        sUpsert = json.dumps({"type": "upsert", "ticket": dictTicket})
+
+        pipe = self.redis.pipeline()
+        if listOld is None:
+            pipe.publish(self.channel(BROADCAST_CHANNEL), sDelete)
+            listOld = []
+        for sChannel in listOld:
+            if sChannel not in listChannels:
+                pipe.publish(self.channel(sChannel), sDelete)
+        for sChannel in listChannels:
+            pipe.publish(self.channel(sChannel), sUpsert)
+        if listChannels:
+            pipe.hset(self.key("items"), sItemID, json.dumps(listChannels))
+        else:
+            pipe.hdel(self.key("items"), sItemID)
+        pipe.execute()
+        return set(listOld) | set(listChannels)
+
+    # Publishes a deleted ticket to the channels it was shown in. Returns those channels.
+    def publish_delete(self, sItemID):
+        listOld = self.last_channels(sItemID)
+        sDelete = json.dumps({"type": "delete", "id": sItemID})
+
+        pipe = self.redis.pipeline()
+        for sChannel in (listOld if listOld is not None else [BROADCAST_CHANNEL]):
+            pipe.publish(self.channel(sChannel), sDelete)
+        pipe.hdel(self.key("items"), sItemID)
+        pipe.execute()
+        return set(listOld or [])
+
+    # Tells every open page to reload (after the subscription was lost)
+    def publish_reset(self):
+        self.redis.publish(self.channel(BROADCAST_CHANNEL), json.dumps({"type": "reset"}))
+
+##############
+# Live Hub
+##############
+
+# Per-process fan-out: one redis pub/sub connection for the whole process (not one per open page),
+# handing each message to the queues of the connections listening on its channel.
+class LiveHub:
+    def __init__(self, redis, prefix="webtickets:live:"):
+        self.redis = redis
+        self.pattern = prefix + "channel:*"
+        self.prefixLength = len(prefix + "channel:")
+        self.lock = threading.Lock()
+        # Channel name -> set of queues
+        self.listeners = {}
+        self.thread = None
+
+    # Returns a queue receiving the messages (as JSON strings) published to any of listChannels
+    def subscribe(self, listChannels):
+        q = queue.Queue()
+        with self.lock:
+            for sChannel in listChannels:
+                self.listeners.setdefault(sChannel, set()).add(q)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.listen, name="live-hub", daemon=True)
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            for sChannel in list(self.listeners):
+                self.listeners[sChannel].discard(q)
+                if not self.listeners[sChannel]:
+                    del self.listeners[sChannel]
+
+    # Number of open connections (the webtickets_live_connections gauge)
+    def connections(self):
+        with self.lock:
+            return len(set().union(*self.listeners.values())) if self.listeners else 0
+
+    def dispatch(self, sChannel, sMessage):
+        with self.lock:
+            listQueues = list(self.listeners.get(sChannel, ()))
+        for q in listQueues:
+            q.put(sMessage)
+
+    # Listener loop, reconnecting when the redis connection drops
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.pattern)
+                for message in pubsub.listen():
+                    sChannel = message["channel"].decode()[self.prefixLength:]
+                    self.dispatch(sChannel, message["data"].decode())
+            except Exception as e:
+                print("Live hub error: " + str(e))
+                # Pages may have missed messages while we were disconnected
+                self.dispatch(BROADCAST_CHANNEL, json.dumps({"type": "reset"}))
+                time.sleep(1)